@@ -27,7 +27,8 @@ async def main():
 
     agent = AgentLoop(
         user_input=user_input,
-        dispatcher=multi_mcp  # now uses dynamic MultiMCP
+        dispatcher=multi_mcp,  # now uses dynamic MultiMCP
+        scope="cli"  # don't read the Telegram chats' memories from the shared store
     )
 
     try:
@@ -37,6 +38,8 @@ async def main():
     except Exception as e:
         log("fatal", f"Agent failed: {e}")
         raise
+    finally:
+        await multi_mcp.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,94 @@
+# bench_chunking.py → Document chunker throughput
+# Usage:
+#   python bench_chunking.py --docs 200                        # synthetic markdown documents
+#   python bench_chunking.py --dir documents --chunkers llm markdown
+#
+# markdown: headings / paragraphs / sentences (modules/chunking.py)
+# semantic: markdown + embedding-similarity boundaries (synthetic embedder unless --real-embeddings)
+# llm:      phi4 semantic_merge from mcp_server_2 (needs Ollama)
+#
+# Reports docs/min, chunks per doc and mean chunk length in words.
+
+import argparse
+import hashlib
+import time
+from pathlib import Path
+
+import numpy as np
+
+from modules import chunking
+
+CHUNK_SIZE = 256
+CHUNK_OVERLAP = 40
+
+
+def synthetic_docs(n: int, seed: int = 0) -> list[str]:
+    rng = np.random.default_rng(seed)
+    docs = []
+    for d in range(n):
+        parts = [f"# Report {d}"]
+        for s in range(rng.integers(3, 8)):
+            parts.append(f"## Section {s}")
+            for p in range(rng.integers(2, 6)):
+                sentences = [
+                    f"Figure {d}.{s}.{p}.{k} shows revenue for segment {rng.integers(100)} changing by {rng.integers(50)} percent."
+                    for k in range(rng.integers(2, 12))
+                ]
+                parts.append(" ".join(sentences))
+        docs.append("\n\n".join(parts))
+    return docs
+
+
+def load_docs(directory: Path) -> list[str]:
+    return [p.read_text(errors="ignore") for p in sorted(directory.glob("*")) if p.suffix.lower() in (".md", ".txt")]
+
+
+def fake_embed(texts: list[str]) -> np.ndarray:
+    seeds = [int(hashlib.md5(t.encode()).hexdigest()[:8], 16) for t in texts]
+    return np.stack([np.random.default_rng(s).standard_normal(64).astype(np.float32) for s in seeds])
+
+
+def build(name: str, args):
+    if name == "markdown":
+        return lambda text: chunking.split_markdown(text, CHUNK_SIZE, CHUNK_OVERLAP)
+    if name == "semantic":
+        embed = fake_embed
+        if args.real_embeddings:
+            from mcp_server_2 import get_embeddings
+            embed = get_embeddings
+        return lambda text: chunking.split_semantic(text, embed, CHUNK_SIZE, CHUNK_OVERLAP)
+    from mcp_server_2 import semantic_merge
+    return semantic_merge
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=200, help="synthetic documents (ignored with --dir)")
+    parser.add_argument("--dir", type=Path, help="directory of .md/.txt documents")
+    parser.add_argument("--chunkers", nargs="+", choices=("markdown", "semantic", "llm"), default=["markdown", "semantic"])
+    parser.add_argument("--real-embeddings", action="store_true", help="semantic: use mcp_server_2's embedding backend")
+    args = parser.parse_args()
+
+    docs = load_docs(args.dir) if args.dir else synthetic_docs(args.docs)
+    words = sum(len(d.split()) for d in docs)
+    print(f"{len(docs)} documents, {words} words")
+
+    for name in args.chunkers:
+        try:
+            split = build(name, args)
+            start = time.perf_counter()
+            chunks = [split(doc) for doc in docs]
+            elapsed = time.perf_counter() - start
+        except Exception as e:
+            print(f"{name:9}: skipped ({e})")
+            continue
+        total = sum(len(c) for c in chunks)
+        mean_words = sum(len(x.split()) for c in chunks for x in c) / max(total, 1)
+        print(
+            f"{name:9}: {len(docs) / elapsed * 60:10.1f} docs/min, "
+            f"{total / len(docs):5.1f} chunks/doc, {mean_words:6.1f} words/chunk"
+        )
+
+
+if __name__ == "__main__":
+    main()
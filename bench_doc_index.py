@@ -0,0 +1,98 @@
+# bench_doc_index.py → Document index types: recall / latency / memory
+# Usage:
+#   python bench_doc_index.py --vectors 200000                    # synthetic clustered 768-d vectors
+#   python bench_doc_index.py --vectors 1000000 --nlist 4096 --nprobe 8 16 32
+#
+# flat:   IndexIDMap2(IndexFlatL2), exact (the ground truth)
+# sq8:    IndexIDMap2(IndexScalarQuantizer 8-bit)
+# ivf_pq: IndexIVFPQ, one row per --nprobe value
+#
+# Reports train time, index size, load time (read vs. mmap), recall@k against flat, how much of the
+# true top k lands in the top --candidates (what search_documents fuses with BM25) and query latency.
+
+import argparse
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from modules.doc_index import INDEX_DEFAULTS, SEARCH_DEFAULTS, make_index, train_quantized
+
+
+def synthetic(n: int, dim: int, latent: int = 48, clusters: int = 512, seed: int = 0) -> np.ndarray:
+    """Embedding-like data: topic clusters on a low-dimensional subspace, plus a little noise."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, latent))
+    points = centres[rng.integers(clusters, size=n)] + 0.5 * rng.standard_normal((n, latent))
+    vectors = points @ rng.standard_normal((latent, dim)) + 0.1 * rng.standard_normal((n, dim))
+    return vectors.astype(np.float32)
+
+
+def load_seconds(path: str, flag: int) -> float:
+    start = time.perf_counter()
+    faiss.read_index(path, flag)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, default=SEARCH_DEFAULTS["candidates"])
+    parser.add_argument("--types", nargs="+", choices=("flat", "sq8", "ivf_pq"), default=["flat", "sq8", "ivf_pq"])
+    parser.add_argument("--nlist", type=int, default=INDEX_DEFAULTS["nlist"])
+    parser.add_argument("--pq-m", type=int, default=INDEX_DEFAULTS["pq_m"])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[INDEX_DEFAULTS["nprobe"]])
+    parser.add_argument("--train-size", type=int, default=INDEX_DEFAULTS["train_size"])
+    args = parser.parse_args()
+
+    data = synthetic(args.vectors + args.queries, args.dim)
+    vectors, queries = data[:args.vectors], data[args.vectors:]
+    ids = np.arange(args.vectors, dtype=np.int64) + 1000  # document id ranges don't start at 0
+    print(f"{args.vectors} x {args.dim}-d vectors, {args.queries} queries, recall@{args.k}")
+
+    flat = make_index(args.dim)
+    flat.add_with_ids(vectors, ids)
+    _, truth = flat.search(queries, args.k)
+
+    workdir = tempfile.mkdtemp(prefix="bench_doc_index_")
+    for kind in args.types:
+        config = {**INDEX_DEFAULTS, "type": kind, "nlist": args.nlist, "pq_m": args.pq_m, "train_size": args.train_size}
+        start = time.perf_counter()
+        index = flat if kind == "flat" else train_quantized(flat, config)
+        trained = time.perf_counter() - start
+
+        path = os.path.join(workdir, f"{kind}.bin")
+        faiss.write_index(index, path)
+        size_mb = os.path.getsize(path) / 2**20
+        mmap_flag = faiss.IO_FLAG_MMAP if kind == "ivf_pq" else getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        read_s, mmap_s = load_seconds(path, 0), load_seconds(path, mmap_flag)
+
+        for nprobe in (args.nprobe if kind == "ivf_pq" else [None]):
+            if nprobe:
+                faiss.extract_index_ivf(index).nprobe = nprobe
+            latencies = []
+            found = []
+            for q in queries:
+                start = time.perf_counter()
+                _, I = index.search(q[None, :], args.candidates)
+                latencies.append(time.perf_counter() - start)
+                found.append(I[0])
+            recall = np.mean([len(set(f[:args.k]) & set(t)) / args.k for f, t in zip(found, truth)])
+            in_candidates = np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)])
+            label = f"{kind} nprobe={nprobe}" if nprobe else kind
+            print(
+                f"{label:20}: train {trained:6.1f}s, {size_mb:8.1f} MB, load {read_s * 1000:7.1f} ms "
+                f"(mmap {mmap_s * 1000:6.1f} ms), recall {recall:.3f} ({in_candidates:.3f} in top {args.candidates}), "
+                f"p50 {np.percentile(latencies, 50) * 1000:6.2f} ms, p95 {np.percentile(latencies, 95) * 1000:6.2f} ms"
+            )
+        os.remove(path)
+    os.rmdir(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# bench_embeddings.py → Embedding backend throughput
+# Usage:
+#   python bench_embeddings.py --texts 2000                          # all backends
+#   python bench_embeddings.py --texts 2000 --backends local local-int8
+#
+# http:       one Ollama /api/embeddings request per text (MemoryManager without a batch endpoint)
+# http-batch: Ollama /api/embed, batch_size texts per request, `workers` concurrent requests (mcp_server_2)
+# local*:     in-process models.json "nomic" model (embedders.py), torch / torch-int8 / onnx / onnx-int8
+#
+# Reports texts/sec and the cosine agreement of each backend with the first one run.
+
+import argparse
+import time
+
+import numpy as np
+
+from modules.embedders import LocalEmbedder, get_embedder
+from modules.memory import MemoryManager
+
+BACKENDS = ("http", "http-batch", "local", "local-int8", "onnx", "onnx-int8")
+
+
+def make_texts(n: int) -> list[str]:
+    return [
+        f"Document chunk {i}: quarterly revenue for segment {i % 13} grew {i % 7}% "
+        f"while operating costs in region {i % 5} fell, according to report {i}."
+        for i in range(n)
+    ]
+
+
+def http_embed(args, batched: bool):
+    manager = MemoryManager(args.url, model_name=args.model, batch_size=args.batch_size,
+                            max_workers=args.workers, use_cache=False)
+    if batched:
+        return manager._compute_embeddings
+    # Single-text endpoint, one request per text
+    manager.embedding_batch_url = None
+    return lambda texts: np.stack([manager._request_embedding(t) for t in texts])
+
+
+def local_embed(args, backend: str, quantize: bool):
+    base = get_embedder(args.local_model)
+    embedder = LocalEmbedder(
+        model=base.model_name, dimension=base.dimension, batch_size=args.batch_size,
+        workers=args.workers, backend=backend, quantize=quantize
+    )
+    return embedder.embed
+
+
+def build(args, name: str):
+    if name == "http":
+        return http_embed(args, batched=False)
+    if name == "http-batch":
+        return http_embed(args, batched=True)
+    backend = "onnx" if name.startswith("onnx") else "torch"
+    return local_embed(args, backend, quantize=name.endswith("int8"))
+
+
+def cosine(a: np.ndarray, b: np.ndarray) -> float:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return float(np.mean(np.sum(a * b, axis=1)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, default=1000)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--url", default="http://localhost:11434/api/embeddings")
+    parser.add_argument("--model", default="nomic-embed-text", help="Ollama model for http backends")
+    parser.add_argument("--local-model", default="nomic", help="models.json key for local backends")
+    args = parser.parse_args()
+
+    texts = make_texts(args.texts)
+    reference = None
+    for name in args.backends:
+        try:
+            embed = build(args, name)
+            embed(texts[:args.batch_size])  # warm-up: model load / connection setup
+            start = time.perf_counter()
+            vectors = embed(texts)
+            elapsed = time.perf_counter() - start
+        except Exception as e:
+            print(f"{name:10}: skipped ({e})")
+            continue
+
+        agreement = ""
+        if reference is None:
+            reference = (name, vectors)
+        elif reference[1].shape == vectors.shape:
+            agreement = f"  cosine vs {reference[0]}: {cosine(reference[1], vectors):.4f}"
+        print(f"{name:10}: {args.texts / elapsed:8.1f} texts/sec{agreement}")
+
+
+if __name__ == "__main__":
+    main()
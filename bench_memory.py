@@ -0,0 +1,211 @@
+# bench_memory.py → MemoryManager benchmarks
+# Usage:
+#   python bench_memory.py bulk --items 10000            # against the Ollama server in profiles.yaml
+#   python bench_memory.py bulk --items 10000 --fake     # synthetic embedder, isolates client-side cost
+#   python bench_memory.py index --vectors 100000         # synthetic vectors, no server needed
+#   python bench_memory.py columns --items 100000         # synthetic vectors, no server needed
+#
+# bulk: items/sec for per-item add() vs batched bulk_add().
+# index: build time, recall@k (vs exact flat search) and query latency for flat / hnsw / ivf.
+# columns: metadata bytes per item (MemoryItem objects vs columnar rows) and retrieve() latency.
+
+import argparse
+import hashlib
+import time
+import tracemalloc
+
+import faiss
+import numpy as np
+import yaml
+
+from modules.memory import MemoryManager, MemoryItem
+from modules.memory_columns import MemoryColumns
+from modules import vector_index
+
+
+def load_memory_config() -> dict:
+    with open("config/profiles.yaml", "r") as f:
+        return yaml.safe_load(f)["memory"]
+
+
+def make_items(n: int) -> list[MemoryItem]:
+    return [
+        MemoryItem(
+            text=f"search_documents(query='topic {i % 97}') → result {i}: lorem ipsum dolor sit amet {i}",
+            type="tool_output",
+            tool_name="search_documents",
+            tags=["search_documents"],
+            session_id=f"session-{i % 50}",
+        )
+        for i in range(n)
+    ]
+
+
+def fake_embedder(dim: int, latency_ms: float):
+    """Deterministic per-text vectors; one sleep per request mimics an HTTP round trip."""
+    def request_embeddings(texts):
+        time.sleep(latency_ms / 1000)
+        seeds = [int(hashlib.md5(t.encode()).hexdigest()[:8], 16) for t in texts]
+        return np.stack([np.random.default_rng(s).standard_normal(dim).astype(np.float32) for s in seeds])
+    return request_embeddings
+
+
+def build_manager(args) -> MemoryManager:
+    config = load_memory_config()
+    manager = MemoryManager(
+        embedding_model_url=config["embedding_url"],
+        model_name=config["embedding_model"],
+        batch_size=args.batch_size,
+        max_workers=args.workers,
+        use_cache=False,
+    )
+    if args.fake:
+        manager.embedding_batch_url = manager.embedding_batch_url or "fake"
+        manager._request_embeddings = fake_embedder(args.dim, args.fake_latency_ms)
+    return manager
+
+
+def bench_bulk(args):
+    items = make_items(args.items)
+
+    baseline = build_manager(args)
+    n = min(args.baseline_items, len(items))
+    start = time.perf_counter()
+    for item in items[:n]:
+        baseline.add(item)
+    per_item_rate = n / (time.perf_counter() - start)
+
+    batched = build_manager(args)
+    start = time.perf_counter()
+    batched.bulk_add(items)
+    bulk_rate = len(items) / (time.perf_counter() - start)
+
+    print(f"add() loop : {per_item_rate:10.1f} items/sec  (measured on {n} items)")
+    print(f"bulk_add() : {bulk_rate:10.1f} items/sec  ({len(items)} items, batch={args.batch_size}, workers={args.workers})")
+    print(f"speedup    : {bulk_rate / per_item_rate:10.1f}x")
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Clustered Gaussian vectors: closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    assignment = rng.integers(0, clusters, n)
+    vectors = centers[assignment] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vector_index.normalize(vectors)
+
+
+def bench_index(args):
+    config = vector_index.index_config(load_memory_config().get("index"))
+    vectors = synthetic_vectors(args.vectors, args.dim, args.clusters)
+    queries = synthetic_vectors(args.queries, args.dim, args.clusters, seed=1)
+    ids = np.arange(len(vectors), dtype=np.int64)
+
+    truth = None
+    print(f"{args.vectors} vectors, dim {args.dim}, {args.queries} queries, k={args.k}")
+    print(f"{'index':6} {'build s':>9} {'recall@k':>9} {'avg ms':>8} {'p95 ms':>8}")
+    for kind in ("flat", "hnsw", "ivf"):
+        start = time.perf_counter()
+        index = vector_index.make_index(kind, args.dim, config, train_vectors=vectors if kind == "ivf" else None)
+        index.add_with_ids(vectors, ids)
+        build = time.perf_counter() - start
+
+        params = vector_index.search_params(index, config)
+        latencies, found = [], []
+        for q in queries:
+            start = time.perf_counter()
+            _, I = index.search(q.reshape(1, -1), args.k, params=params)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append(I[0])
+        found = np.stack(found)
+        if truth is None:
+            truth = found  # flat is exact
+        recall = np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)])
+        print(f"{kind:6} {build:9.2f} {recall:9.3f} {np.mean(latencies):8.3f} {np.percentile(latencies, 95):8.3f}")
+
+
+def traced_bytes(build) -> tuple[object, int]:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, used
+
+
+def bench_columns(args):
+    items = make_items(args.items)
+    for i, item in enumerate(items):
+        item.user_query = f"user question {i % 500}"
+        item.scope = f"telegram:{i % 200}"
+
+    # Text is shared by both layouts (pydantic keeps the str, the arena copies the bytes),
+    # so compare like for like: objects are rebuilt from copies of the text
+    _, object_bytes = traced_bytes(lambda: {i: item.model_copy(update={"text": item.text + ""}) for i, item in enumerate(items)})
+
+    def build_columns():
+        columns = MemoryColumns()
+        for i, item in enumerate(items, start=1):
+            columns.append(i, item, vector_bytes=0)
+        return columns
+
+    columns, column_bytes = traced_bytes(build_columns)
+    print(f"{args.items} items")
+    print(f"MemoryItem dict : {object_bytes / args.items:8.1f} bytes/item")
+    print(f"columnar rows   : {column_bytes / args.items:8.1f} bytes/item  (columns + arena: {columns.nbytes() / args.items:.1f})")
+
+    args.fake = True
+    args.fake_latency_ms = 0.0
+    args.batch_size, args.workers = 1024, 4
+    manager = build_manager(args)
+    manager.index_config["type"] = "flat"
+    manager.bulk_add(items)
+
+    for label, kwargs in (
+        ("unfiltered", {}),
+        ("type filter", {"type_filter": "tool_output"}),
+        ("scope filter", {"scope_filter": "telegram:7"}),
+        ("scope+session", {"scope_filter": "telegram:7", "session_filter": "session-7"}),
+    ):
+        start = time.perf_counter()
+        for q in range(args.queries):
+            manager.retrieve(f"query {q}", top_k=3, **kwargs)
+        print(f"retrieve {label:14}: {(time.perf_counter() - start) / args.queries * 1000:7.3f} ms/query")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    bulk = sub.add_parser("bulk", help="per-item add() vs batched bulk_add()")
+    bulk.add_argument("--items", type=int, default=10_000)
+    bulk.add_argument("--baseline-items", type=int, default=500, help="items for the slow add() loop")
+    bulk.add_argument("--batch-size", type=int, default=64)
+    bulk.add_argument("--workers", type=int, default=4)
+    bulk.add_argument("--fake", action="store_true", help="use a synthetic embedder instead of Ollama")
+    bulk.add_argument("--fake-latency-ms", type=float, default=15.0)
+    bulk.add_argument("--dim", type=int, default=768)
+    bulk.set_defaults(func=bench_bulk)
+
+    index = sub.add_parser("index", help="recall/latency of flat vs hnsw vs ivf")
+    index.add_argument("--vectors", type=int, default=100_000)
+    index.add_argument("--queries", type=int, default=200)
+    index.add_argument("--dim", type=int, default=768)
+    index.add_argument("--clusters", type=int, default=256)
+    index.add_argument("-k", type=int, default=10)
+    index.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads")
+    index.set_defaults(func=bench_index)
+
+    columns = sub.add_parser("columns", help="memory per item and retrieval time for the columnar rows")
+    columns.add_argument("--items", type=int, default=100_000)
+    columns.add_argument("--queries", type=int, default=100)
+    columns.add_argument("--dim", type=int, default=768)
+    columns.set_defaults(func=bench_columns)
+
+    args = parser.parse_args()
+    if getattr(args, "threads", None):
+        faiss.omp_set_num_threads(args.threads)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# bench_startup.py → Import-time profile for agent startup
+# Usage: python bench_startup.py [module] [--runs N]
+#
+# Runs `python -X importtime -c "import <module>"` in fresh interpreters and
+# reports the median wall time plus the slowest cumulative imports, so the
+# cost of what agent.py pulls in before the first prompt can be compared
+# across commits (e.g. before/after lazy ModelManager construction).
+
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s+(.*)")
+
+
+def profile_once(module: str) -> tuple[float, list[tuple[int, str]]]:
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr.strip().splitlines()[-1])
+
+    cumulative = []
+    for line in proc.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            cumulative.append((int(match.group(2)), match.group(3).strip()))
+    return elapsed, cumulative
+
+
+def main():
+    args = sys.argv[1:]
+    runs = 5
+    if "--runs" in args:
+        i = args.index("--runs")
+        runs = int(args[i + 1])
+        del args[i:i + 2]
+    module = args[0] if args else "core.loop"
+
+    timings = []
+    cumulative = []
+    for _ in range(runs):
+        elapsed, cumulative = profile_once(module)
+        timings.append(elapsed)
+
+    print(f"import {module}: median {statistics.median(timings) * 1000:.0f} ms over {runs} runs")
+    print("Slowest cumulative imports (last run):")
+    for us, name in sorted(cumulative, reverse=True)[:15]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,19 +15,23 @@
 
 # config/profiles.yaml
 
-# Inputs: User query + session_id
+# Inputs: User query + session_id + scope (user/chat the memories belong to)
 
 # Outputs: State object available to all layers
 
 # core/context.py
 
 from typing import List, Optional, Dict, Any
-from modules.memory import MemoryManager, MemoryItem
+from modules.memory import MemoryManager, MemoryItem, get_memory_manager
 from pathlib import Path
 import yaml
 import time
 import uuid
 
+# Scope of callers that don't name one (the CLI agent). scope=None is an explicit global view:
+# it reads every user's/chat's memories, so it must be asked for, never defaulted to.
+DEFAULT_SCOPE = "cli"
+
 class AgentProfile:
     def __init__(self, config_path: str = "config/profiles.yaml"):
         with open(config_path, "r") as f:
@@ -53,15 +57,14 @@ class ToolCallTrace:
         self.result = result
 
 class AgentContext:
-    def __init__(self, user_input: str, profile: Optional[AgentProfile] = None):
+    def __init__(self, user_input: str, profile: Optional[AgentProfile] = None, scope: Optional[str] = DEFAULT_SCOPE):
         self.user_input = user_input
         self.agent_profile = profile or AgentProfile()
         self.session_id = f"session-{int(time.time())}-{uuid.uuid4().hex[:6]}"
+        self.scope = scope
         self.step = 0
-        self.memory = MemoryManager(
-            embedding_model_url=self.agent_profile.memory_config["embedding_url"],
-            model_name=self.agent_profile.memory_config["embedding_model"]
-        )
+        # Shared, persistent store when memory.persist_dir is set; fresh in-memory one otherwise
+        self.memory: MemoryManager = get_memory_manager(self.agent_profile.memory_config)
         self.memory_trace: List[MemoryItem] = []
         self.tool_calls: List[ToolCallTrace] = []
         self.final_answer: Optional[str] = None
@@ -1,18 +1,19 @@
 # core/loop.py
 
 import asyncio
-from core.context import AgentContext
+from core.context import AgentContext, DEFAULT_SCOPE
 from core.session import MultiMCP
 from core.strategy import decide_next_action
 from modules.perception import extract_perception, PerceptionResult
 from modules.action import ToolCallResult, parse_function_call
 from modules.memory import MemoryItem
 import json
+from typing import Optional
 
 
 class AgentLoop:
-    def __init__(self, user_input: str, dispatcher: MultiMCP):
-        self.context = AgentContext(user_input)
+    def __init__(self, user_input: str, dispatcher: MultiMCP, scope: Optional[str] = DEFAULT_SCOPE):
+        self.context = AgentContext(user_input, scope=scope)
         self.mcp = dispatcher
         self.tools = dispatcher.get_all_tools()
 
@@ -81,12 +82,12 @@ class AgentLoop:
 
                 print(f"[perception] Intent: {perception.intent}, Hint: {perception.tool_hint}")
 
-                # 💾 Memory Retrieval
+                # 💾 Memory Retrieval (across sessions, within this user's/chat's scope)
                 retrieved = self.context.memory.retrieve(
                     query=query,
                     top_k=self.context.agent_profile.memory_config["top_k"],
                     type_filter=self.context.agent_profile.memory_config.get("type_filter", None),
-                    session_filter=self.context.session_id
+                    scope_filter=self.context.scope
                 )
                 print(f"[memory] Retrieved {len(retrieved)} memories")
 
@@ -137,7 +138,8 @@ class AgentLoop:
                         tool_name=tool_name,
                         user_query=query,
                         tags=[tool_name],
-                        session_id=self.context.session_id
+                        session_id=self.context.session_id,
+                        scope=self.context.scope
                     )
                     self.context.add_memory(memory_item)
 
@@ -1,5 +1,6 @@
 # core/session.py
 
+import asyncio
 import os
 import sys
 from typing import Optional, Any, List, Dict
@@ -47,15 +48,59 @@ class MCP:
                 return await session.call_tool(tool_name, arguments=arguments)
 
 
+class PersistentSession:
+    """
+    One stdio session kept open across tool calls. A dedicated task owns it (the transport's
+    cancel scopes must be exited by the task that entered them); a dead server is restarted
+    on the next call.
+    """
+
+    def __init__(self, params: StdioServerParameters):
+        self.params = params
+        self._session: Optional[ClientSession] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> ClientSession:
+        async with self._lock:
+            if self._task is None or self._task.done():
+                ready = asyncio.get_running_loop().create_future()
+                self._stop = asyncio.Event()
+                self._task = asyncio.create_task(self._run(ready))
+                self._session = await ready
+            return self._session
+
+    async def _run(self, ready: asyncio.Future):
+        try:
+            async with stdio_client(self.params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    ready.set_result(session)
+                    await self._stop.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                print(f"❌ MCP server {self.params.args[0]} session ended: {e}")
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            self._stop.set()
+            await self._task
+
+
 class MultiMCP:
     """
-    Stateless version: discovers tools from multiple MCP servers, but reconnects per tool call.
-    Each call_tool() uses a fresh session based on tool-to-server mapping.
+    Discovers tools from multiple MCP servers and keeps one session per server open, so a
+    server's background work (e.g. mcp_server_2's document indexer) outlives a tool call.
+    call_tool() routes by the tool-to-server mapping; shutdown() stops the servers.
     """
 
     def __init__(self, server_configs: List[dict]):
         self.server_configs = server_configs
         self.tool_map: Dict[str, Dict[str, Any]] = {}  # tool_name → {config, tool}
+        self.sessions: Dict[str, PersistentSession] = {}  # script → open session
 
     async def initialize(self):
         print("in MultiMCP initialize")
@@ -92,16 +137,14 @@ class MultiMCP:
             raise ValueError(f"Tool '{tool_name}' not found on any server.")
 
         config = entry["config"]
-        params = StdioServerParameters(
-            command=sys.executable,
-            args=[config["script"]],
-            cwd=config.get("cwd", os.getcwd())
-        )
-
-        async with stdio_client(params) as (read, write):
-            async with ClientSession(read, write) as session:
-                await session.initialize()
-                return await session.call_tool(tool_name, arguments)
+        if config["script"] not in self.sessions:
+            self.sessions[config["script"]] = PersistentSession(StdioServerParameters(
+                command=sys.executable,
+                args=[config["script"]],
+                cwd=config.get("cwd", os.getcwd())
+            ))
+        session = await self.sessions[config["script"]].get()
+        return await session.call_tool(tool_name, arguments)
 
     async def list_all_tools(self) -> List[str]:
         return list(self.tool_map.keys())
@@ -110,4 +153,6 @@ class MultiMCP:
         return [entry["tool"] for entry in self.tool_map.values()]
 
     async def shutdown(self):
-        pass  # no persistent sessions to close
\ No newline at end of file
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions.clear()
\ No newline at end of file
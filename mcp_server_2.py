@@ -11,7 +11,6 @@ import faiss
 import numpy as np
 from pathlib import Path
 import requests
-from markitdown import MarkItDown
 import time
 from models import AddInput, AddOutput, SqrtInput, SqrtOutput, StringsToIntsInput, StringsToIntsOutput, ExpSumInput, ExpSumOutput, PythonCodeInput, PythonCodeOutput, UrlInput, FilePathInput, MarkdownInput, MarkdownOutput, ChunkListOutput
 from tqdm import tqdm
@@ -19,31 +18,99 @@ import hashlib
 from pydantic import BaseModel
 import subprocess
 import sqlite3
-import trafilatura
-import pymupdf4llm
 import re
+import yaml
+from fnmatch import fnmatch
 import base64 # ollama needs base64-encoded-image
+from modules.singleflight import SingleFlight, make_key
+from modules.embedding_cache import get_embedding_cache
+from modules.embedders import get_embedder
+from modules.doc_index import DocumentIndex, index_kind, make_index
+from modules.ingest import IngestPipeline, Document, extract_pdf_markdown, extract_webpage_markdown, page_batches
+from modules import chunking
+from modules.captions import Captioner, CaptionCache
+from modules.doc_watcher import BackgroundIndexer, DirectoryWatcher
+from modules.query_cache import QueryCache
 
 
 mcp = FastMCP("Calculator")
 
-EMBED_URL = "http://localhost:11434/api/embeddings"
+EMBED_URL = "http://localhost:11434/api/embed"  # batch endpoint: {"input": [...]} → normalized "embeddings"
 OLLAMA_CHAT_URL = "http://localhost:11434/api/chat"
 OLLAMA_URL = "http://localhost:11434/api/generate"
 EMBED_MODEL = "nomic-embed-text"
+# http: Ollama at EMBED_URL | a models.json huggingface key (e.g. nomic): in-process CPU model
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "http")
 GEMMA_MODEL = "gemma3:12b"
 PHI_MODEL = "phi4:latest"
 CHUNK_SIZE = 256
 CHUNK_OVERLAP = 40
 MAX_CHUNK_LENGTH = 512  # characters
 TOP_K = 3  # FAISS top-K matches
+# Ingestion pipeline: extraction processes, chunking/embedding threads, docs buffered between stages
+EXTRACT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+CHUNK_WORKERS = 2
+EMBED_WORKERS = 1
+EMBED_BATCH = 64  # chunks per embedding call (small documents are coalesced)
+INGEST_QUEUE_SIZE = 4
+MAX_BATCH_QUERIES = 8  # search_documents_batch: queries beyond this are dropped
+PDF_PAGE_BATCH = 16  # longer PDFs are extracted, embedded and made searchable this many pages at a time (0 = whole file)
+PUBLISH_INTERVAL = 10.0  # seconds: page batches are published (index written + copied) at most this often
+COMPACT_RATIO = 0.2  # compact the chunk store once removed chunks reach this fraction of the index
+CAPTION_WORKERS = 2  # concurrent gemma caption requests
+WATCH_INTERVAL = 2.0  # seconds between documents/ polls
+INDEX_WAIT_TIMEOUT = 600.0  # seconds a search waits for the first index build before giving up
 ROOT = Path(__file__).parent.resolve()
 
+embedder = get_embedder(EMBED_BACKEND) if EMBED_BACKEND != "http" else None
+# The endpoint is part of the namespace: /api/embed vectors are normalized, /api/embeddings ones aren't
+EMBED_SOURCE = embedder.namespace if embedder else f"{EMBED_MODEL}/api/embed"
+
+def load_documents_config() -> dict:
+    with open(ROOT / "config" / "profiles.yaml", "r") as f:
+        return yaml.safe_load(f).get("documents") or {}
+
+DOCUMENTS_CONFIG = load_documents_config()
+
+embedding_flight = SingleFlight()
+embedding_cache = get_embedding_cache(EMBED_SOURCE)
+
+# Loaded once at startup; process_documents publishes new generations, other writers are picked up by polling
+doc_index = DocumentIndex(ROOT / "faiss_index", config=DOCUMENTS_CONFIG.get("index"))
+
+# Search results per (index generation, normalized query); a new generation invalidates them
+QUERY_CACHE_CONFIG = DOCUMENTS_CONFIG.get("cache") or {}
+query_cache = QueryCache(
+    capacity=QUERY_CACHE_CONFIG.get("size", 256),
+    semantic_threshold=QUERY_CACHE_CONFIG.get("semantic_threshold")
+)
+
 
 def get_embedding(text: str) -> np.ndarray:
-    response = requests.post(EMBED_URL, json={"model": EMBED_MODEL, "prompt": text})
-    response.raise_for_status()
-    return np.array(response.json()["embedding"], dtype=np.float32)
+    cached = embedding_cache.get(text)
+    if cached is not None:
+        return cached
+    # Concurrent identical queries share one embedding request
+    return embedding_flight.do(make_key(EMBED_SOURCE, text), _request_embedding, text)
+
+def get_embeddings(texts: list[str]) -> np.ndarray:
+    """Batch form of get_embedding: cached texts are reused, the rest embedded together."""
+    return embedding_cache.get_or_compute(texts, _compute_embeddings)
+
+def _request_embedding(text: str) -> np.ndarray:
+    embedding = _compute_embeddings([text])[0]
+    embedding_cache.put(text, embedding)
+    return embedding
+
+def _compute_embeddings(texts: list[str]) -> np.ndarray:
+    if embedder:
+        return embedder.embed(texts)
+    embeddings = []
+    for start in range(0, len(texts), EMBED_BATCH):
+        response = requests.post(EMBED_URL, json={"model": EMBED_MODEL, "input": texts[start:start + EMBED_BATCH]})
+        response.raise_for_status()
+        embeddings.append(np.array(response.json()["embeddings"], dtype=np.float32))
+    return np.concatenate(embeddings)
 
 def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
     words = text.split()
@@ -95,42 +162,117 @@ Just respond in one word (Yes or No), and do not provide any further explanation
 
 
 
+def searchable_snapshot():
+    """The published document index; with none yet, built first (None if that outlasts INDEX_WAIT_TIMEOUT)."""
+    snapshot = doc_index.current() or doc_index.reload()
+    if snapshot is None:
+        ensure_faiss_ready()
+        snapshot = doc_index.current() or doc_index.reload()
+    return snapshot
+
+
+def index_not_ready() -> str:
+    status = indexer.status()
+    if status["last_error"] and not status["indexing"]:
+        return f"ERROR: Document index build failed: {status['last_error']}"
+    return f"ERROR: Document index is still being built ({status['queue_depth']} file(s) queued); try again shortly"
+
+
+def cached_search(snapshot, queries: list[str]) -> list[list[dict]]:
+    """doc_index.search_batch through the query cache: queries it answers are neither embedded nor searched."""
+    results = [query_cache.get(snapshot.generation, query) for query in queries]
+    pending = [i for i, hits in enumerate(results) if hits is None]
+    if not pending:
+        return results
+    texts = [queries[i] for i in pending]
+    vectors = get_embedding(texts[0]).reshape(1, -1) if len(texts) == 1 else get_embeddings(texts)
+    misses = []
+    for i, vector in zip(pending, vectors):
+        results[i] = query_cache.similar(snapshot.generation, queries[i], vector)
+        if results[i] is None:
+            misses.append((i, vector))
+    if misses:
+        found = doc_index.search_batch(
+            snapshot, np.stack([v for _, v in misses]), [queries[i] for i, _ in misses], DOCUMENTS_CONFIG.get("search")
+        )
+        for (i, vector), hits in zip(misses, found):
+            query_cache.put(snapshot.generation, queries[i], hits, vector)
+            results[i] = hits
+    return results
+
+
+def format_hit(data: dict) -> str:
+    return f"{data['chunk']}\n[Source: {data['doc']}, ID: {data['chunk_id']}]"
+
+
 @mcp.tool()
 def search_documents(query: str) -> list[str]:
     """Search indexed documents for relevant content. Usage: search_documents|query="india Current GDP" """
-    ensure_faiss_ready()
     mcp_log("SEARCH", f"Query: {query}")
     try:
-        index = faiss.read_index(str(ROOT / "faiss_index" / "index.bin"))
-        metadata = json.loads((ROOT / "faiss_index" / "metadata.json").read_text())
-        query_vec = get_embedding(query).reshape(1, -1)
-        D, I = index.search(query_vec, k=5)
-        results = []
-        for idx in I[0]:
-            data = metadata[idx]
-            results.append(f"{data['chunk']}\n[Source: {data['doc']}, ID: {data['chunk_id']}]")
-        return results
+        snapshot = searchable_snapshot()
+        if snapshot is None:
+            return [index_not_ready()]
+        # Dense + BM25 with rank fusion; only the hits are read from the chunk store
+        return [format_hit(data) for data in cached_search(snapshot, [query])[0]]
     except Exception as e:
         return [f"ERROR: Failed to search: {str(e)}"]
 
 
-def caption_image(img_url_or_path: str) -> str:
-    mcp_log("CAPTION", f"🖼️ Attempting to caption image: {img_url_or_path}")
+@mcp.tool()
+def search_documents_batch(queries: list[str]) -> list[str]:
+    """Search indexed documents for several queries in one call (e.g. each entity in a comparison); one result group per query, each chunk listed once. Usage: search_documents_batch|queries=["Gensol Engineering", "Go-Auto"]"""
+    queries = list(dict.fromkeys(q.strip() for q in queries if q.strip()))
+    if len(queries) > MAX_BATCH_QUERIES:
+        mcp_log("WARN", f"Batch search: keeping the first {MAX_BATCH_QUERIES} of {len(queries)} queries")
+        queries = queries[:MAX_BATCH_QUERIES]
+    mcp_log("SEARCH", f"Queries: {queries}")
+    if not queries:
+        return ["ERROR: No queries given"]
+    try:
+        snapshot = searchable_snapshot()
+        if snapshot is None:
+            return [index_not_ready()]
+        # One embedding batch and one multi-row FAISS search for all queries the cache can't answer
+        groups = cached_search(snapshot, queries)
+
+        # A chunk several queries found is listed under the one that ranks it highest
+        matches: dict[tuple, list[tuple[int, int]]] = {}
+        for q, hits in enumerate(groups):
+            for rank, data in enumerate(hits):
+                matches.setdefault((data["doc"], data["chunk_id"]), []).append((rank, q))
+        results = []
+        for q, (query, hits) in enumerate(zip(queries, groups)):
+            lines = []
+            for data in hits:
+                (_, owner), *others = sorted(matches[(data["doc"], data["chunk_id"])])
+                if owner != q:
+                    continue
+                also = f"\n[Also matches: {', '.join(queries[o] for _, o in others)}]" if others else ""
+                lines.append(format_hit(data) + also)
+            body = "\n\n".join(lines) if lines else "No additional results (see the other queries)."
+            results.append(f"### Query: {query}\n\n{body}")
+        return results
+    except Exception as e:
+        return [f"ERROR: Failed to search: {str(e)}"]
 
-    full_path = Path(__file__).parent / "documents" / img_url_or_path
-    full_path = full_path.resolve()
 
+def load_image(img_url_or_path: str) -> bytes:
+    if img_url_or_path.startswith("http"): # for extract_web_pages
+        response = requests.get(img_url_or_path)
+        response.raise_for_status()
+        return response.content
+    full_path = (Path(__file__).parent / "documents" / img_url_or_path).resolve()
     if not full_path.exists():
         mcp_log("ERROR", f"❌ Image file not found: {full_path}")
-        return f"[Image file not found: {img_url_or_path}]"
+        raise FileNotFoundError(img_url_or_path)
+    return full_path.read_bytes()
 
+
+def request_caption(image: bytes) -> str | None:
+    """One gemma call; None on failure so the result isn't cached."""
     try:
-        if img_url_or_path.startswith("http"): # for extract_web_pages
-            response = requests.get(img_url_or_path)
-            encoded_image = base64.b64encode(response.content).decode("utf-8")
-        else:
-            with open(full_path, "rb") as img_file:
-                encoded_image = base64.b64encode(img_file.read()).decode("utf-8")
+        encoded_image = base64.b64encode(image).decode("utf-8")
 
         # Set stream=True to get the full generator-style output
         with requests.post(OLLAMA_URL, json={
@@ -154,51 +296,70 @@ def caption_image(img_url_or_path: str) -> str:
 
             caption = "".join(caption_parts).strip()
             mcp_log("CAPTION", f"✅ Caption generated: {caption}")
-            return caption if caption else "[No caption returned]"
+            return caption or None
 
     except Exception as e:
-        mcp_log("ERROR", f"⚠️ Failed to caption image {img_url_or_path}: {e}")
-        return f"[Image could not be processed: {img_url_or_path}]"
+        mcp_log("ERROR", f"⚠️ Failed to caption image: {e}")
+        return None
 
 
+# Captions are cached by image content, so logos repeated on every page are captioned once
+captioner = Captioner(
+    caption_fn=request_caption,
+    load_fn=load_image,
+    cache=CaptionCache(ROOT / "faiss_index" / "captions.db"),
+    model=GEMMA_MODEL,
+    workers=CAPTION_WORKERS
+)
 
 
+def caption_image(img_url_or_path: str) -> str:
+    mcp_log("CAPTION", f"🖼️ Attempting to caption image: {img_url_or_path}")
+    caption = captioner.caption(img_url_or_path)
+    if caption is None:
+        return f"[Image could not be processed: {img_url_or_path}]"
+    return caption or "[Decorative image skipped]"
+
 
 def replace_images_with_captions(markdown: str) -> str:
+    pattern = r'!\[(.*?)\]\((.*?)\)'
+    sources = [match.group(2) for match in re.finditer(pattern, markdown)]
+    if not sources:
+        return markdown
+    # All distinct images of the document at once, on the bounded caption pool
+    captions = captioner.caption_many(sources)
+
     def replace(match):
-        alt, src = match.group(1), match.group(2)
+        src = match.group(2)
+        caption = captions.get(src)
+        if caption is None:
+            return f"[Image could not be processed: {src}]"
+        return f"**Image:** {caption}" if caption else ""  # decorative images are dropped
+
+    markdown = re.sub(pattern, replace, markdown)
+
+    for src in dict.fromkeys(sources):
+        # Attempt to delete only if local and file exists
+        if src.startswith("http"):
+            continue
         try:
-            caption = caption_image(src)
-            # Attempt to delete only if local and file exists
-            if not src.startswith("http"):
-                img_path = Path(__file__).parent / "documents" / src
-                if img_path.exists():
-                    img_path.unlink()
-                    mcp_log("INFO", f"🗑️ Deleted image after captioning: {img_path}")
-            return f"**Image:** {caption}"
+            img_path = Path(__file__).parent / "documents" / src
+            if img_path.exists():
+                img_path.unlink()
+                mcp_log("INFO", f"🗑️ Deleted image after captioning: {img_path}")
         except Exception as e:
             mcp_log("WARN", f"Image deletion failed: {e}")
-            return f"[Image could not be processed: {src}]"
-
-    return re.sub(r'!\[(.*?)\]\((.*?)\)', replace, markdown)
+    return markdown
 
 
 @mcp.tool()
 def extract_webpage(input: UrlInput) -> MarkdownOutput:
     """Extract and convert webpage content to markdown. Usage: extract_webpage|input={"url": "https://example.com"}"""
 
-    downloaded = trafilatura.fetch_url(input.url)
-    if not downloaded:
+    markdown = extract_webpage_markdown(input.url)
+    if markdown is None:
         return MarkdownOutput(markdown="Failed to download the webpage.")
 
-    markdown = trafilatura.extract(
-        downloaded,
-        include_comments=False,
-        include_tables=True,
-        include_images=True,
-        output_format='markdown'
-    ) or ""
-
     markdown = replace_images_with_captions(markdown)
     return MarkdownOutput(markdown=markdown)
 
@@ -209,25 +370,11 @@ def extract_pdf(input: FilePathInput) -> MarkdownOutput:
     if not os.path.exists(input.file_path):
         return MarkdownOutput(markdown=f"File not found: {input.file_path}")
 
-    ROOT = Path(__file__).parent.resolve()
-    global_image_dir = ROOT / "documents" / "images"
-    global_image_dir.mkdir(parents=True, exist_ok=True)
-
-    # Actual markdown with relative image paths
-    markdown = pymupdf4llm.to_markdown(
-        input.file_path,
-        write_images=True,
-        image_path=str(global_image_dir)
-    )
-
-    # Re-point image links in the markdown
-    markdown = re.sub(
-        r'!\[\]\((.*?/images/)([^)]+)\)',
-        r'![](images/\2)',
-        markdown.replace("\\", "/")
+    # Page batch by page batch, so only one batch's raw markdown and images exist at a time
+    markdown = "".join(
+        replace_images_with_captions(extract_pdf_markdown(input.file_path, pages))
+        for pages in page_batches(input.file_path, PDF_PAGE_BATCH)
     )
-
-    markdown = replace_images_with_captions(markdown)
     return MarkdownOutput(markdown=markdown)
 
 
@@ -301,106 +448,215 @@ Keep markdown formatting intact.
 
 
 
-def process_documents():
-    """Process documents and create FAISS index using unified multimodal strategy."""
+def chunker_for(file_name: str) -> str:
+    """Chunker for a document: first matching `collections` pattern, else the default."""
+    for pattern, chunker in (DOCUMENTS_CONFIG.get("collections") or {}).items():
+        if fnmatch(file_name, pattern):
+            return chunker
+    return DOCUMENTS_CONFIG.get("chunker", "markdown")
+
+
+def split_document(markdown: str, chunker: str = "markdown") -> list[str]:
+    if chunker == "llm":
+        return semantic_merge(markdown)
+    if chunker == "semantic":
+        return chunking.split_semantic(
+            markdown, get_embeddings, CHUNK_SIZE, CHUNK_OVERLAP,
+            threshold=DOCUMENTS_CONFIG.get("semantic_threshold")
+        )
+    return chunking.split_markdown(markdown, CHUNK_SIZE, CHUNK_OVERLAP)
+
+
+def process_documents(names: set[str] | None = None) -> int:
+    """
+    Process documents and create FAISS index using unified multimodal strategy.
+    `names` limits the run to those files (changed or deleted); None scans all of documents/.
+    Returns the number of files fully indexed.
+    """
     mcp_log("INFO", "Indexing documents with unified RAG pipeline...")
     ROOT = Path(__file__).parent.resolve()
     DOC_PATH = ROOT / "documents"
     INDEX_CACHE = ROOT / "faiss_index"
     INDEX_CACHE.mkdir(exist_ok=True)
-    INDEX_FILE = INDEX_CACHE / "index.bin"
-    METADATA_FILE = INDEX_CACHE / "metadata.json"
-    CACHE_FILE = INDEX_CACHE / "doc_index_cache.json"
 
     def file_hash(path):
         return hashlib.md5(Path(path).read_bytes()).hexdigest()
 
-    CACHE_META = json.loads(CACHE_FILE.read_text()) if CACHE_FILE.exists() else {}
-    metadata = json.loads(METADATA_FILE.read_text()) if METADATA_FILE.exists() else []
-    index = faiss.read_index(str(INDEX_FILE)) if INDEX_FILE.exists() else None
+    # Private copy: searches keep using the published snapshot while this run changes it
+    index = doc_index.writable()
+    documents = doc_index.chunks.documents()
+
+    # An index built with another embedding backend lives in a different vector space: rebuild it
+    EMBEDDER_FILE = INDEX_CACHE / "embedder.txt"
+    built_with = EMBEDDER_FILE.read_text().strip() if EMBEDDER_FILE.exists() else f"{EMBED_MODEL}/api/embeddings"
+    rebuild = None
+    if built_with != EMBED_SOURCE:
+        rebuild = f"embedding backend changed ({built_with} → {EMBED_SOURCE})"
+    elif index is not None and index_kind(index) is None:
+        rebuild = "positional index from before per-document id ranges"
+    elif index is not None and index_kind(index) not in ("flat", doc_index.config["type"]):
+        # A flat index is trained into the configured type below; compressed vectors can't be converted back
+        rebuild = f"index type changed ({index_kind(index)} → {doc_index.config['type']})"
+    if rebuild:
+        mcp_log("INFO", f"Re-indexing all documents: {rebuild}")
+        index, stale, names = None, set(documents), None
+    else:
+        stale = doc_index.reconcile(index) if index is not None else set(documents)
+
+    files = {file.name: file for file in DOC_PATH.glob("*.*")}
+    if names is not None:
+        # Watcher batch: just these files, plus any the index was found to be missing
+        files = {name: file for name, file in files.items() if name in names or name in stale}
+        documents_gone = (documents.keys() & names) - files.keys()
+    else:
+        documents_gone = documents.keys() - files.keys()
+    for name in documents_gone:
+        doc_index.remove_document(index, name)
+        mcp_log("PURGE", f"Removed deleted file from index: {name}")
 
-    for file in DOC_PATH.glob("*.*"):
+    hashes = {}
+    for name, file in files.items():
         fhash = file_hash(file)
-        if file.name in CACHE_META and CACHE_META[file.name] == fhash:
-            mcp_log("SKIP", f"Skipping unchanged file: {file.name}")
+        known = documents.get(name)
+        if known and known.hash == fhash and name not in stale:
+            mcp_log("SKIP", f"Skipping unchanged file: {name}")
             continue
+        hashes[file] = fhash
+
+    def chunk(doc: Document) -> list[str]:
+        # Captions are LLM calls (I/O), so they run here rather than in the extraction processes
+        markdown = replace_images_with_captions(doc.markdown)
+        if not markdown.strip():
+            mcp_log("WARN", f"No content extracted from {doc.label}")
+            return []
+        if len(markdown.split()) < 10:
+            mcp_log("WARN", f"Content too short for chunking in {doc.label} → Skipping chunking.")
+            return [markdown.strip()]
+        chunker = chunker_for(doc.path.name)
+        mcp_log("INFO", f"Chunking {doc.label} ({len(markdown.split())} words) with the {chunker} chunker")
+        return split_document(markdown, chunker)
+
+    written = set()
+    last_publish, unpublished = time.monotonic(), False
+
+    def write(doc: Document):
+        nonlocal index, last_publish, unpublished
+        new_metadata = [
+            {"doc": doc.path.name, "chunk": chunk, "chunk_id": f"{doc.path.stem}_{doc.chunk_offset + i}"}
+            for i, chunk in enumerate(doc.chunks)
+        ]
+        if index is None:
+            if not doc.chunks:
+                return  # empty page batch and nothing indexed yet
+            index = make_index(doc.vectors.shape[1])
+
+        # ✅ Immediately store chunks, swap the document's vectors in the index (atomically) and publish.
+        # Page batches become searchable every PUBLISH_INTERVAL (each publish writes and copies the whole
+        # index) and with the document's last one; the hash is recorded only once the whole file is in,
+        # so an interrupted or partly failed document is re-indexed on the next run.
+        complete = doc.last and not doc.failed
+        publish = doc.last or time.monotonic() - last_publish >= PUBLISH_INTERVAL
+        doc_index.replace_document(
+            index, doc.path.name, hashes[doc.path] if complete else "", new_metadata, doc.vectors,
+            append=doc.part > 0, publish=publish
+        )
+        if publish:
+            last_publish = time.monotonic()
+        unpublished = not publish
+        EMBEDDER_FILE.write_text(EMBED_SOURCE)
+        if complete:
+            written.add(doc.path.name)
+        mcp_log("SAVE", f"{'Saved FAISS index and metadata' if publish else 'Stored chunks'} after processing {doc.label}")
+        quantize()
+
+    def quantize():
+        # Train the compressed index as soon as there are enough vectors, so the flat copy stays small
+        nonlocal index
+        kind = index_kind(index)
+        index = doc_index.quantize(index)
+        if index_kind(index) != kind:
+            mcp_log("TRAIN", f"Trained {index_kind(index)} index on {index.ntotal} vectors (was {kind})")
+
+    pipeline = IngestPipeline(
+        chunk=chunk,
+        embed=get_embeddings,
+        write=write,
+        extract_workers=EXTRACT_WORKERS,
+        chunk_workers=CHUNK_WORKERS,
+        embed_workers=EMBED_WORKERS,
+        embed_batch=EMBED_BATCH,
+        queue_size=INGEST_QUEUE_SIZE,
+        page_batch=PDF_PAGE_BATCH,
+        log=mcp_log
+    )
+    mcp_log("PROC", f"Processing {len(hashes)} changed document(s)")
+    pipeline.run(list(hashes))
+    mcp_log("STATS", f"captions: {captioner.stats}")
+    if unpublished:
+        doc_index.publish(index)  # a document's last part never reached the writer
+    if index is not None:
+        quantize()  # e.g. index type switched to a compressed one with no documents changed
 
-        mcp_log("PROC", f"Processing: {file.name}")
-        try:
-            ext = file.suffix.lower()
-            markdown = ""
-
-            if ext == ".pdf":
-                mcp_log("INFO", f"Using MuPDF4LLM to extract {file.name}")
-                markdown = extract_pdf(FilePathInput(file_path=str(file))).markdown
-
-            elif ext in [".html", ".htm", ".url"]:
-                mcp_log("INFO", f"Using Trafilatura to extract {file.name}")
-                markdown = extract_webpage(UrlInput(url=file.read_text().strip())).markdown
+    removed = doc_index.chunks.removed_since_compaction()
+    if rebuild or (index is not None and removed > COMPACT_RATIO * max(index.ntotal, 1)):
+        compact_documents()
+    return len(written)
 
-            else:
-                # Fallback to MarkItDown for other formats
-                converter = MarkItDown()
-                mcp_log("INFO", f"Using MarkItDown fallback for {file.name}")
-                markdown = converter.convert(str(file)).text_content
-
-            if not markdown.strip():
-                mcp_log("WARN", f"No content extracted from {file.name}")
-                continue
-
-            if len(markdown.split()) < 10:
-                mcp_log("WARN", f"Content too short for semantic merge in {file.name} → Skipping chunking.")
-                chunks = [markdown.strip()]
-            else:
-                mcp_log("INFO", f"Running semantic merge on {file.name} with {len(markdown.split())} words")
-                chunks = semantic_merge(markdown)
-
-
-            embeddings_for_file = []
-            new_metadata = []
-            for i, chunk in enumerate(tqdm(chunks, desc=f"Embedding {file.name}")):
-                embedding = get_embedding(chunk)
-                embeddings_for_file.append(embedding)
-                new_metadata.append({
-                    "doc": file.name,
-                    "chunk": chunk,
-                    "chunk_id": f"{file.stem}_{i}"
-                })
-
-            if embeddings_for_file:
-                if index is None:
-                    dim = len(embeddings_for_file[0])
-                    index = faiss.IndexFlatL2(dim)
-                index.add(np.stack(embeddings_for_file))
-                metadata.extend(new_metadata)
-                CACHE_META[file.name] = fhash
-
-                # ✅ Immediately save index and metadata
-                CACHE_FILE.write_text(json.dumps(CACHE_META, indent=2))
-                METADATA_FILE.write_text(json.dumps(metadata, indent=2))
-                faiss.write_index(index, str(INDEX_FILE))
-                mcp_log("SAVE", f"Saved FAISS index and metadata after processing {file.name}")
 
-        except Exception as e:
-            mcp_log("ERROR", f"Failed to process {file.name}: {e}")
+def compact_documents():
+    """Drop chunk rows no document owns (replaced/purged documents, interrupted runs) and VACUUM."""
+    deleted = doc_index.compact()
+    mcp_log("COMPACT", f"Chunk store compacted: {deleted} orphaned rows removed")
 
 
 
 def ensure_faiss_ready():
-    from pathlib import Path
+    """
+    Build the index if there is none yet and wait for it (up to INDEX_WAIT_TIMEOUT): the caller
+    may be a per-call server process that is stopped as soon as it answers. The build still
+    runs on the indexer thread, the single writer.
+    """
     index_path = ROOT / "faiss_index" / "index.bin"
-    meta_path = ROOT / "faiss_index" / "metadata.json"
-    if not (index_path.exists() and meta_path.exists()):
-        mcp_log("INFO", "Index not found — running process_documents()...")
-        process_documents()
-    else:
+    if index_path.exists():
         mcp_log("INFO", "Index already exists. Skipping regeneration.")
+        return
+    mcp_log("INFO", "Index not found — running process_documents()...")
+    indexer.request_full_scan()
+    indexer.start(full_scan=False)
+    if not indexer.wait_idle(INDEX_WAIT_TIMEOUT):
+        mcp_log("WARN", f"Index still building after {INDEX_WAIT_TIMEOUT:.0f}s")
+
+
+# Single writer: every index change goes through this thread; searches read published snapshots
+indexer = BackgroundIndexer(
+    index_fn=process_documents,
+    watcher=DirectoryWatcher(ROOT / "documents"),
+    poll_interval=WATCH_INTERVAL,
+    log=mcp_log
+)
+
+
+@mcp.tool()
+def index_status() -> dict:
+    """Background document indexing status: queued files, current batch, last indexed time. Usage: index_status"""
+    snapshot = doc_index.current()
+    return {
+        **indexer.status(),
+        "indexed_chunks": snapshot.index.ntotal if snapshot else 0,
+        "index_generation": snapshot.generation if snapshot else None,
+        "query_cache": {**query_cache.stats, "entries": len(query_cache)},
+    }
 
 
 if __name__ == "__main__":
     print("STARTING THE SERVER AT AMAZING LOCATION")
 
+    # Resident index: load before serving, then follow changes from other processes
+    doc_index.reload()
+    doc_index.watch()
+
     if len(sys.argv) > 1 and sys.argv[1] == "dev":
+        indexer.start()
         mcp.run() # Run without transport for dev server
     else:
         # Start the server in a separate thread
@@ -412,8 +668,8 @@ if __name__ == "__main__":
         # Wait a moment for the server to start
         time.sleep(2)
         
-        # Process documents after server is running
-        process_documents()
+        # Index documents in the background after the server is running, then follow documents/
+        indexer.start()
         
         # Keep the main thread alive
         try:
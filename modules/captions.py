@@ -0,0 +1,153 @@
+# modules/captions.py → Image Caption Cache
+# Role: Caption document images once per distinct image, several at a time.
+
+# Responsibilities:
+
+# Key captions by sha256 of the image bytes (+ captioning model) in a small SQLite table
+
+# Skip tiny / decorative images (icons, rules, blank fills) before any model call
+
+# Caption the remaining distinct images on a bounded thread pool; identical concurrent requests share one call
+
+# Used by: mcp_server_2.py (replace_images_with_captions, caption_image)
+
+# modules/captions.py
+
+import hashlib
+import io
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from modules.singleflight import SingleFlight
+
+# Below these an image is treated as decorative and dropped from the markdown
+MIN_BYTES = 1024
+MIN_SIDE = 32              # pixels, either dimension
+MIN_AREA = 64 * 64         # pixels
+MAX_ASPECT = 20            # thinner than 1:20 → divider / rule
+MIN_STDDEV = 3.0           # grayscale std-dev; lower → blank or solid fill
+
+
+def is_decorative(data: bytes) -> bool:
+    """Cheap size/content heuristics; unreadable images are kept (the captioner decides)."""
+    if len(data) < MIN_BYTES:
+        return True
+    try:
+        from PIL import Image, ImageStat
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+            if min(width, height) < MIN_SIDE or width * height < MIN_AREA:
+                return True
+            if max(width, height) / max(min(width, height), 1) > MAX_ASPECT:
+                return True
+            image.thumbnail((64, 64))
+            return ImageStat.Stat(image.convert("L")).stddev[0] < MIN_STDDEV
+    except Exception:
+        return False
+
+
+class CaptionCache:
+    def __init__(self, path: Path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS captions (key TEXT PRIMARY KEY, caption TEXT NOT NULL, created REAL)")
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT caption FROM captions WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, caption: str):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO captions (key, caption, created) VALUES (?, ?, ?)", (key, caption, time.time())
+            )
+
+
+class Captioner:
+    """
+    `caption_fn(image_bytes)` returns a caption, or None on failure (failures aren't cached).
+    `load_fn(src)` returns the image bytes for a markdown image link.
+    """
+
+    def __init__(
+        self,
+        caption_fn: Callable[[bytes], Optional[str]],
+        load_fn: Callable[[str], bytes],
+        cache: CaptionCache,
+        model: str,
+        workers: int = 2
+    ):
+        self.caption_fn = caption_fn
+        self.load_fn = load_fn
+        self.cache = cache
+        self.model = model
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="caption")
+        self._flight = SingleFlight()
+        self.stats = {"images": 0, "cached": 0, "captioned": 0, "decorative": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _caption(self, key: str, data: bytes) -> Optional[str]:
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._count("cached")
+            return cached
+        caption = self.caption_fn(data)
+        if caption:
+            self.cache.put(key, caption)
+            self._count("captioned")
+        else:
+            self._count("failed")
+        return caption
+
+    def caption_many(self, sources: List[str]) -> Dict[str, Optional[str]]:
+        """
+        src → caption for each distinct source: "" for decorative images, None when the image
+        couldn't be loaded or captioned.
+        """
+        results: Dict[str, Optional[str]] = {}
+        by_key: Dict[str, List[str]] = {}
+        payloads: Dict[str, bytes] = {}
+        for src in dict.fromkeys(sources):
+            self._count("images")
+            try:
+                data = self.load_fn(src)
+            except Exception:
+                self._count("failed")
+                results[src] = None
+                continue
+            if is_decorative(data):
+                self._count("decorative")
+                results[src] = ""
+                continue
+            key = f"{self.model}:{hashlib.sha256(data).hexdigest()}"
+            by_key.setdefault(key, []).append(src)
+            payloads[key] = data
+
+        # Distinct images only; the same image captioned elsewhere right now is shared
+        futures = {
+            key: self._pool.submit(self._flight.do, key, self._caption, key, payloads[key])
+            for key in by_key
+        }
+        for key, future in futures.items():
+            try:
+                caption = future.result()
+            except Exception:
+                caption = None
+            for src in by_key[key]:
+                results[src] = caption
+        return results
+
+    def caption(self, src: str) -> Optional[str]:
+        return self.caption_many([src])[src]
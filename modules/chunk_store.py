@@ -0,0 +1,288 @@
+# modules/chunk_store.py → Document Chunk Store
+# Role: Chunk text + source for each document vector, looked up by FAISS vector id.
+
+# Responsibilities:
+
+# SQLite table keyed by vector id (INTEGER PRIMARY KEY = rowid, so lookup is one B-tree probe)
+
+# Each document owns one contiguous id range (first_id, count) plus its content hash; a page-streamed
+# document owns one more range per appended page batch
+
+# Ids are allocated monotonically and never reused, so a stale snapshot can't read another document's text
+
+# Searches read only the rows they return (memory O(result), not O(corpus))
+
+# BM25 keyword side-index (FTS5 over doc name + chunk text), kept in sync by triggers
+
+# One-time import of the legacy metadata.json list
+
+# Used by: doc_index.py (DocumentIndex), mcp_server_2.py
+
+# modules/chunk_store.py
+
+import json
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    vector_id   INTEGER PRIMARY KEY,  -- FAISS id (IndexIDMap2)
+    doc         TEXT NOT NULL,
+    chunk_id    TEXT NOT NULL,
+    chunk       TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    name        TEXT PRIMARY KEY,
+    hash        TEXT NOT NULL,
+    first_id    INTEGER NOT NULL,
+    count       INTEGER NOT NULL
+);
+-- Ranges appended to a document after its first (page-streamed extraction)
+CREATE TABLE IF NOT EXISTS document_parts (
+    name        TEXT NOT NULL,
+    first_id    INTEGER NOT NULL,
+    count       INTEGER NOT NULL,
+    PRIMARY KEY (name, first_id)
+);
+-- Range lookup by id (OWNED): the nearest range start at or below it
+CREATE INDEX IF NOT EXISTS documents_first_id ON documents (first_id);
+CREATE INDEX IF NOT EXISTS document_parts_first_id ON document_parts (first_id);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+
+-- External-content FTS5 index: postings only, the text stays in `chunks`
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    doc, chunk, content='chunks', content_rowid='vector_id', tokenize='unicode61'
+);
+-- Per-term document frequencies, to drop terms that match most of the corpus
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_vocab USING fts5vocab(chunks_fts, 'row');
+CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+    INSERT INTO chunks_fts (rowid, doc, chunk) VALUES (new.vector_id, new.doc, new.chunk);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN
+    INSERT INTO chunks_fts (chunks_fts, rowid, doc, chunk) VALUES ('delete', old.vector_id, old.doc, old.chunk);
+END;
+"""
+
+# Too common to help ranking, and each one would make the BM25 scan touch most of the corpus
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were what when "
+    "where which who why how with".split()
+)
+
+COLUMNS = ("doc", "chunk_id", "chunk")
+MAX_DF = 0.2  # keyword search ignores terms found in more than this fraction of chunks
+MIN_DF_CORPUS = 2000  # ... once the store has this many chunks (below it, one document can dominate)
+
+# Whether vector id `{id}` is inside a document's range. Ranges within each table never overlap,
+# so only the one starting nearest below the id can hold it: one index seek per table.
+OWNED = (
+    "(COALESCE((SELECT first_id + count FROM documents WHERE first_id <= {id} ORDER BY first_id DESC LIMIT 1), 0) > {id}"
+    " OR COALESCE((SELECT first_id + count FROM document_parts WHERE first_id <= {id} ORDER BY first_id DESC LIMIT 1), 0) > {id})"
+)
+
+
+class DocRange(NamedTuple):
+    hash: str
+    first_id: int
+    count: int
+    parts: Tuple[Tuple[int, int], ...] = ()  # further (first_id, count) ranges, in append order
+
+    def spans(self) -> Tuple[Tuple[int, int], ...]:
+        return ((self.first_id, self.count), *self.parts)
+
+    def ids(self) -> List[int]:
+        return [i for first_id, count in self.spans() for i in range(first_id, first_id + count)]
+
+    @property
+    def total(self) -> int:
+        return sum(count for _, count in self.spans())
+
+
+class ChunkStore:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # INSERT OR REPLACE must fire the delete trigger for the replaced row
+        self._db.execute("PRAGMA recursive_triggers=ON")
+        self._db.executescript(SCHEMA)
+        if not self._meta("fts_built"):
+            # Store created before the keyword index existed: index the rows already there
+            self._db.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+            self._set_meta("fts_built", 1)
+        self._db.commit()
+
+    def _append(self, start_id: int, rows: List[dict]):
+        self._db.executemany(
+            f"INSERT OR REPLACE INTO chunks (vector_id, {', '.join(COLUMNS)}) VALUES (?, ?, ?, ?)",
+            [(start_id + i, *(row[c] for c in COLUMNS)) for i, row in enumerate(rows)]
+        )
+
+    def _meta(self, key: str) -> int:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _set_meta(self, key: str, value: int):
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _range(self, name: str) -> Optional[DocRange]:
+        row = self._db.execute("SELECT hash, first_id, count FROM documents WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        parts = self._db.execute(
+            "SELECT first_id, count FROM document_parts WHERE name = ? ORDER BY first_id", (name,)
+        ).fetchall()
+        return DocRange(*row, tuple(parts))
+
+    def put_document(
+        self, name: str, file_hash: str, rows: List[dict], append: bool = False
+    ) -> Tuple[DocRange, Optional[DocRange]]:
+        """
+        Store a document's chunks under a fresh id range and point the document at it, in one
+        transaction. Returns (new range, previous range); the previous rows stay until delete_range.
+        `append` adds the range to the document's current ones instead (no previous range).
+        """
+        with self._lock, self._db:
+            max_id = self._db.execute("SELECT MAX(vector_id) FROM chunks").fetchone()[0]
+            first_id = max(self._meta("next_id"), (max_id + 1) if max_id is not None else 0)
+            self._set_meta("next_id", first_id + len(rows))
+            self._append(first_id, rows)
+
+            previous = self._range(name)
+            if append and previous is not None:
+                if rows:
+                    self._db.execute(
+                        "INSERT INTO document_parts (name, first_id, count) VALUES (?, ?, ?)", (name, first_id, len(rows))
+                    )
+                self._db.execute("UPDATE documents SET hash = ? WHERE name = ?", (file_hash, name))
+                return DocRange(file_hash, first_id, len(rows)), None
+
+            self._db.execute("DELETE FROM document_parts WHERE name = ?", (name,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents (name, hash, first_id, count) VALUES (?, ?, ?, ?)",
+                (name, file_hash, first_id, len(rows))
+            )
+        return DocRange(file_hash, first_id, len(rows)), previous
+
+    def forget_document(self, name: str) -> Optional[DocRange]:
+        """Drop the document record (its rows go with delete_range once the index no longer has them)."""
+        with self._lock, self._db:
+            previous = self._range(name)
+            self._db.execute("DELETE FROM documents WHERE name = ?", (name,))
+            self._db.execute("DELETE FROM document_parts WHERE name = ?", (name,))
+        return previous
+
+    def delete_range(self, doc_range: DocRange):
+        with self._lock, self._db:
+            self._db.executemany(
+                "DELETE FROM chunks WHERE vector_id >= ? AND vector_id < ?",
+                [(first_id, first_id + count) for first_id, count in doc_range.spans()]
+            )
+            self._set_meta("removed", self._meta("removed") + doc_range.total)
+
+    def documents(self) -> Dict[str, DocRange]:
+        with self._lock:
+            rows = self._db.execute("SELECT name, hash, first_id, count FROM documents").fetchall()
+            parts: Dict[str, list] = {}
+            for name, first_id, count in self._db.execute(
+                "SELECT name, first_id, count FROM document_parts ORDER BY name, first_id"
+            ):
+                parts.setdefault(name, []).append((first_id, count))
+        return {
+            name: DocRange(file_hash, first_id, count, tuple(parts.get(name, ())))
+            for name, file_hash, first_id, count in rows
+        }
+
+    def get_many(self, vector_ids: Iterable[int]) -> Dict[int, dict]:
+        ids = [int(i) for i in vector_ids]
+        if not ids:
+            return {}
+        with self._lock:
+            records = self._db.execute(
+                f"SELECT vector_id, {', '.join(COLUMNS)} FROM chunks WHERE vector_id IN ({','.join('?' * len(ids))})",
+                ids
+            ).fetchall()
+        return {record[0]: dict(zip(COLUMNS, record[1:])) for record in records}
+
+    def keyword_search(self, query: str, k: int, doc_weight: float = 2.0) -> List[int]:
+        """Vector ids of the `k` best BM25 matches for any of the query's terms, best first."""
+        terms = [t for t in dict.fromkeys(re.findall(r"\w+", query.lower())) if len(t) > 1 and t not in STOPWORDS]
+        if not terms:
+            return []
+        with self._lock:
+            # Terms in more than MAX_DF of the chunks (e.g. "pdf" from file names) add almost nothing
+            # to BM25 but make it score most of the corpus; keep only the selective ones. A small store
+            # is cheap to score in full, and there a single document's name can exceed MAX_DF.
+            # Upper bound on the row count; separate subqueries so each is a single B-tree seek
+            total = self._db.execute(
+                "SELECT (SELECT MAX(vector_id) FROM chunks) - (SELECT MIN(vector_id) FROM chunks) + 1"
+            ).fetchone()[0] or 0
+            frequencies = {}
+            for term in terms:
+                # One equality lookup per term: fts5vocab only seeks on `term = ?` (IN scans the vocabulary)
+                row = self._db.execute("SELECT doc FROM chunks_vocab WHERE term = ?", (term,)).fetchone()
+                frequencies[term] = row[0] if row else 0
+            cutoff = MAX_DF * total if total >= MIN_DF_CORPUS else total
+            terms = [t for t in terms if 0 < frequencies[t] <= cutoff]
+            if not terms:
+                return []
+            match = " OR ".join(f'"{t}"' for t in terms)
+            query = "SELECT rowid FROM chunks_fts WHERE chunks_fts MATCH ? {} ORDER BY bm25(chunks_fts, ?, 1.0) LIMIT ?"
+            ids = [row[0] for row in self._db.execute(query.format(""), (match, doc_weight, k))]
+            # Rows no document owns (old versions of an interrupted replace, legacy rows) have no
+            # vectors any more; their stale text must not come back through the keyword side.
+            # Checking just the top k keeps the common case (no such rows) at one FTS query.
+            owned = {row[0] for row in self._db.execute(
+                f"SELECT vector_id FROM chunks WHERE vector_id IN ({','.join('?' * len(ids))})"
+                f" AND {OWNED.format(id='chunks.vector_id')}", ids
+            )} if ids else set()
+            if len(owned) < len(ids):
+                ids = [row[0] for row in self._db.execute(
+                    query.format(f"AND {OWNED.format(id='chunks_fts.rowid')}"), (match, doc_weight, k)
+                )]
+        return ids
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def removed_since_compaction(self) -> int:
+        with self._lock:
+            return self._meta("removed")
+
+    def _delete_unowned(self) -> int:
+        return self._db.execute(f"DELETE FROM chunks WHERE NOT {OWNED.format(id='chunks.vector_id')}").rowcount
+
+    def delete_unowned(self) -> int:
+        """Delete rows outside every document's range (crash leftovers, legacy rows); counted as removed."""
+        with self._lock, self._db:
+            deleted = self._delete_unowned()
+            if deleted:
+                self._set_meta("removed", self._meta("removed") + deleted)
+        return deleted
+
+    def compact(self) -> int:
+        """Delete rows outside every document's range (crash leftovers, legacy rows); VACUUM."""
+        with self._lock:
+            with self._db:
+                deleted = self._delete_unowned()
+                self._set_meta("removed", 0)
+            self._db.execute("VACUUM")
+        return deleted
+
+    def import_json(self, metadata_path: Path) -> int:
+        """Load a legacy metadata.json (list position = vector id) and retire the file."""
+        metadata = json.loads(Path(metadata_path).read_text())
+        with self._lock, self._db:
+            self._append(0, metadata)
+        Path(metadata_path).rename(Path(metadata_path).with_suffix(".json.migrated"))
+        return len(metadata)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,167 @@
+# modules/chunking.py → Structure-aware Document Chunking
+# Role: Split extracted markdown into retrieval chunks without an LLM call per window.
+
+# Responsibilities:
+
+# Respect markdown structure: headings start sections, paragraphs and fenced code stay whole when they fit
+
+# Fall back to sentences, then word windows, for paragraphs longer than a chunk
+
+# Pack pieces up to `size` words with `overlap` words carried between chunks of the same section
+
+# Optional: extra boundaries where adjacent paragraphs' embeddings are dissimilar
+
+# Deterministic: the same text always gives the same chunks
+
+# Used by: mcp_server_2.py (process_documents)
+
+# modules/chunking.py
+
+import re
+from typing import Callable, Iterable, List, NamedTuple, Optional, Set
+
+import numpy as np
+
+HEADING = re.compile(r"^#{1,6}\s")
+FENCE = re.compile(r"^\s*(```|~~~)")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+
+class Unit(NamedTuple):
+    text: str
+    words: int
+    kind: str  # heading | paragraph | sentence (continues the previous unit's paragraph)
+
+
+def _blocks(markdown: str) -> Iterable[tuple[str, str]]:
+    """(kind, text) for headings and paragraphs in order; fenced code blocks are one paragraph."""
+    lines: List[str] = []
+    fenced = False
+    for line in markdown.splitlines():
+        if FENCE.match(line):
+            fenced = not fenced
+            lines.append(line)
+            continue
+        if fenced:
+            lines.append(line)
+        elif HEADING.match(line):
+            if lines:
+                yield "paragraph", "\n".join(lines)
+                lines = []
+            yield "heading", line.strip()
+        elif not line.strip():
+            if lines:
+                yield "paragraph", "\n".join(lines)
+                lines = []
+        else:
+            lines.append(line)
+    if lines:
+        yield "paragraph", "\n".join(lines)
+
+
+def units(markdown: str, size: int) -> List[Unit]:
+    """Headings and paragraphs; paragraphs over `size` words become sentences, then word windows."""
+    result = []
+    for kind, text in _blocks(markdown):
+        words = text.split()
+        if not words:
+            continue
+        if kind == "heading" or len(words) <= size:
+            result.append(Unit(text.strip(), len(words), kind))
+            continue
+        first = True
+        for sentence in SENTENCE_END.split(text):
+            sentence_words = sentence.split()
+            for i in range(0, len(sentence_words), size):
+                window = sentence_words[i:i + size]
+                result.append(Unit(" ".join(window), len(window), "paragraph" if first else "sentence"))
+                first = False
+    return result
+
+
+def _join(pieces: List[Unit]) -> str:
+    text = ""
+    for unit in pieces:
+        separator = " " if unit.kind == "sentence" else "\n\n"
+        text = f"{text}{separator}{unit.text}" if text else unit.text
+    return text
+
+
+def _split(unit: Unit, n: int) -> tuple[Unit, Unit]:
+    """First `n` words of `unit`, and the rest (which continues the same paragraph)."""
+    words = unit.text.split()
+    return Unit(" ".join(words[:n]), n, unit.kind), Unit(" ".join(words[n:]), len(words) - n, "sentence")
+
+
+def _tail(pieces: List[Unit], overlap: int) -> List[Unit]:
+    """The last `overlap` words of `pieces`, cutting into the earliest unit reached (never a heading)."""
+    carry: List[Unit] = []
+    carried = 0
+    for previous in reversed(pieces):
+        if carried >= overlap:
+            break
+        if carried + previous.words > overlap:
+            if previous.kind == "heading":
+                break
+            previous = _split(previous, previous.words - (overlap - carried))[1]
+        carry.insert(0, previous)
+        carried += previous.words
+    return carry
+
+
+def pack(pieces: List[Unit], size: int, overlap: int, breaks: Optional[Set[int]] = None) -> List[str]:
+    """
+    Greedy packing up to `size` words. Headings (and `breaks`) start a new chunk once the
+    current one has at least size/4 words; overlap is never carried across those boundaries.
+    Otherwise each chunk starts with the previous chunk's last `overlap` words (at most size/2).
+    """
+    breaks = breaks or set()
+    min_words = size // 4
+    overlap = min(overlap, size // 2)
+    chunks: List[str] = []
+    current: List[Unit] = []
+    current_words = 0
+
+    for i, unit in enumerate(pieces):
+        boundary = unit.kind == "heading" or i in breaks
+        while current and (current_words + unit.words > size or (boundary and current_words >= min_words)):
+            room = size - current_words
+            if not boundary and unit.words > size - overlap and room > 0:
+                # Too long to ever follow an overlap whole: its head fills up this chunk
+                head, unit = _split(unit, room)
+                current.append(head)
+            chunks.append(_join(current))
+            current = [] if boundary else _tail(current, overlap)
+            current_words = sum(u.words for u in current)
+        current.append(unit)
+        current_words += unit.words
+
+    if current:
+        chunks.append(_join(current))
+    return chunks
+
+
+def split_markdown(markdown: str, size: int, overlap: int) -> List[str]:
+    return pack(units(markdown, size), size, overlap)
+
+
+def split_semantic(
+    markdown: str,
+    embed: Callable[[List[str]], np.ndarray],
+    size: int,
+    overlap: int,
+    threshold: Optional[float] = None
+) -> List[str]:
+    """
+    split_markdown plus a boundary wherever adjacent units' cosine similarity drops below
+    `threshold` (default: one standard deviation under the document's mean).
+    """
+    pieces = units(markdown, size)
+    if len(pieces) < 3:
+        return pack(pieces, size, overlap)
+    vectors = np.asarray(embed([u.text for u in pieces]), dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarity = np.sum(vectors[:-1] * vectors[1:], axis=1)
+    cut = threshold if threshold is not None else float(similarity.mean() - similarity.std())
+    breaks = {i + 1 for i, s in enumerate(similarity) if s < cut}
+    return pack(pieces, size, overlap, breaks)
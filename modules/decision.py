@@ -1,9 +1,8 @@
 from typing import List, Optional
 from modules.perception import PerceptionResult
 from modules.memory import MemoryItem
-from modules.model_manager import ModelManager
+from modules.model_manager import get_model_manager
 from dotenv import load_dotenv
-from google import genai
 import os
 import asyncio
 
@@ -16,8 +15,6 @@ except ImportError:
         now = datetime.datetime.now().strftime("%H:%M:%S")
         print(f"[{now}] [{stage}] {msg}")
 
-model = ModelManager()
-
 
 async def generate_plan(
     perception: PerceptionResult,
@@ -31,7 +28,8 @@ async def generate_plan(
     memory_texts = "\n".join(f"- {m.text}" for m in memory_items) or "None"
     tool_context = f"\nYou have access to the following tools:\n{tool_descriptions}" if tool_descriptions else ""
 
-    prompt = f"""
+    # Static prefix: only changes when the tool set does, so the backend can cache it
+    prefix = f"""
 You are a reasoning-driven AI agent with access to tools and memory.
 Your job is to solve the user's request step-by-step by reasoning through the problem, selecting a tool if needed, and continuing until the FINAL_ANSWER is produced.
 
@@ -39,19 +37,8 @@ Respond in **exactly one line** using one of the following formats:
 
 - FUNCTION_CALL: tool_name|param1=value1|param2=value2
 - FINAL_ANSWER: [your final result] *(Not description, but actual final answer)
-
-🧠 Context:
-- Step: {step_num} of {max_steps}
-- Memory: 
-{memory_texts}
 {tool_context}
 
-🎯 Input Summary:
-- User input: "{perception.user_input}"
-- Intent: {perception.intent}
-- Entities: {', '.join(perception.entities)}
-- Tool hint: {perception.tool_hint or 'None'}
-
 ✅ Examples:
 - FUNCTION_CALL: add|a=5|b=3
 - FUNCTION_CALL: strings_to_chars_to_int|input.string=INDIA
@@ -70,6 +57,7 @@ Respond in **exactly one line** using one of the following formats:
 
 - 🚫 Do NOT invent tools. Use only the tools listed above. Tool description has useage pattern, only use that.
 - 📄 If the question may relate to public/factual knowledge (like companies, people, places), use the `search_documents` tool to look for the answer.
+- 📄 If the question compares or relates several entities, search for all of them in ONE `search_documents_batch` call (one query per entity) instead of several `search_documents` calls.
 - 🧮 If the question is mathematical, use the appropriate math tool.
 - 🔁 Analyze that whether you have already got a good factual result from a tool, do NOT search again — summarize and respond with FINAL_ANSWER.
 - ❌ NEVER repeat tool calls with the same parameters unless the result was empty. When searching rely on first reponse from tools, as that is the best response probably.
@@ -79,11 +67,30 @@ Respond in **exactly one line** using one of the following formats:
 - ⏳ You have 3 attempts. Final attempt must end with FINAL_ANSWER.
 """
 
+    # Per-step suffix
+    prompt = f"""
+🧠 Context:
+- Step: {step_num} of {max_steps}
+- Memory: 
+{memory_texts}
+
+🎯 Input Summary:
+- User input: "{perception.user_input}"
+- Intent: {perception.intent}
+- Entities: {', '.join(perception.entities)}
+- Tool hint: {perception.tool_hint or 'None'}
+"""
+
 
 
     try:
-        raw = (await model.generate_text(prompt)).strip()
+        model = get_model_manager()
+        # The last allowed step has to produce the answer, so it jumps the queue
+        priority = "final" if step_num >= max_steps else "plan"
+        raw, usage = await model.generate_text_with_usage(prompt, prefix=prefix, priority=priority)
+        raw = raw.strip()
         log("plan", f"LLM output: {raw}")
+        log("plan", f"Input tokens: {usage['prompt_tokens']} (cached: {usage['cached_tokens']})")
 
         for line in raw.splitlines():
             if line.strip().startswith("FUNCTION_CALL:") or line.strip().startswith("FINAL_ANSWER:"):
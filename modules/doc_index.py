@@ -0,0 +1,357 @@
+# modules/doc_index.py → Resident Document Index
+# Role: Keep the document FAISS index in memory for search_documents; chunk text stays in chunk_store.py.
+
+# Responsibilities:
+
+# Load index.bin once; searches use the in-memory snapshot and fetch only their result chunks
+
+# Writers append chunk rows first, then save the index atomically (tmp file + rename) and bump a generation file
+
+# Hot reload in the background when the generation/mtime changes; swap the snapshot in one assignment
+
+# Never expose a half-written index: every vector in a loaded index has its chunk row
+
+# Per-document replace/purge: ids are IndexIDMap2 ids from the document's range in chunk_store.py
+
+# Hybrid search: FAISS + BM25 (chunk_store.py) rankings merged by weighted reciprocal-rank fusion
+
+# Optional compressed index (SQ8 / IVF-PQ): starts flat, trained once enough vectors exist; mmap loading
+
+# Used by: mcp_server_2.py (search_documents, search_documents_batch, process_documents)
+
+# modules/doc_index.py
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set
+
+import faiss
+import numpy as np
+
+from modules.chunk_store import ChunkStore, DocRange
+
+
+SEARCH_DEFAULTS = {
+    "top_k": 5,             # results returned
+    "candidates": 50,       # per retriever, before fusion
+    "rrf_k": 60,            # RRF damping: higher flattens the rank contribution
+    "vector_weight": 1.0,
+    "keyword_weight": 1.0,  # 0 → dense-only search
+    "doc_weight": 2.0,      # BM25 weight of file-name matches relative to chunk text
+}
+
+
+INDEX_DEFAULTS = {
+    "type": "flat",         # flat (4 bytes/dim, exact) | sq8 (1 byte/dim) | ivf_pq (pq_m bytes/vector)
+    "nlist": 1024,          # ivf_pq: coarse clusters
+    "pq_m": 64,             # ivf_pq: sub-quantizers per vector (must divide the dimension)
+    "pq_bits": 8,           # ivf_pq: bits per sub-quantizer code
+    "nprobe": 16,           # ivf_pq: clusters scanned per query (recall vs. latency)
+    "train_size": 100_000,  # the index stays flat until it holds this many vectors, then trains on them
+    "mmap": False,          # map index.bin read-only instead of loading it into every process
+}
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], weights: Sequence[float], k: int = 60) -> List[int]:
+    """Ids ordered by sum(weight / (k + rank)) over the rankings they appear in."""
+    scores: Dict[int, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + weight / (k + rank)
+    return sorted(scores, key=scores.__getitem__, reverse=True)
+
+
+class Snapshot(NamedTuple):
+    generation: int
+    index: faiss.Index
+
+
+def make_index(dim: int) -> faiss.IndexIDMap2:
+    """Empty document index; vector ids come from each document's id range."""
+    return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+
+
+def index_kind(index: faiss.Index) -> Optional[str]:
+    """flat | sq8 | ivf_pq, or None for a positional index from before per-document id ranges."""
+    if isinstance(index, faiss.IndexIDMap2):
+        inner = faiss.downcast_index(index.index)
+        if isinstance(inner, faiss.IndexScalarQuantizer):
+            return "sq8"
+        if isinstance(inner, faiss.IndexFlat):
+            return "flat"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"  # IVF stores the ids itself; no IDMap2 needed
+    return None
+
+
+def training_size(config: dict) -> int:
+    """Vectors needed before the configured index type is trained (k-means wants ~39 per centroid)."""
+    if config["type"] == "ivf_pq":
+        return max(config["train_size"], 39 * max(config["nlist"], 2 ** config["pq_bits"]))
+    return config["train_size"]
+
+
+def stored_ids(index: faiss.Index) -> np.ndarray:
+    if isinstance(index, faiss.IndexIDMap2):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+    invlists = faiss.extract_index_ivf(index).invlists
+    lists = [
+        faiss.rev_swig_ptr(invlists.get_ids(i), invlists.list_size(i)).copy()
+        for i in range(invlists.nlist) if invlists.list_size(i)
+    ]
+    return np.concatenate(lists).astype(np.int64) if lists else np.empty(0, dtype=np.int64)
+
+
+def train_quantized(flat: faiss.IndexIDMap2, config: dict) -> faiss.Index:
+    """The configured compressed index, trained on `flat`'s vectors and holding them under the same ids."""
+    ids = faiss.vector_to_array(flat.id_map).astype(np.int64)
+    vectors = flat.index.reconstruct_n(0, flat.ntotal)
+    if config["type"] == "sq8":
+        index = faiss.IndexIDMap2(faiss.IndexScalarQuantizer(flat.d, faiss.ScalarQuantizer.QT_8bit))
+    else:
+        index = faiss.index_factory(flat.d, f"IVF{config['nlist']},PQ{config['pq_m']}x{config['pq_bits']}")
+        index.do_polysemous_training = False  # index_factory default; only Hamming-filtered search uses it
+        index.nprobe = config["nprobe"]
+    sample = vectors
+    if len(vectors) > config["train_size"]:
+        sample = vectors[np.random.default_rng(0).choice(len(vectors), config["train_size"], replace=False)]
+    index.train(sample)
+    index.add_with_ids(vectors, ids)
+    return index
+
+
+def _ids(doc_range: DocRange) -> np.ndarray:
+    return np.concatenate([np.arange(first_id, first_id + count, dtype=np.int64) for first_id, count in doc_range.spans()])
+
+
+def _replace(tmp: Path, path: Path):
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class DocumentIndex:
+    def __init__(self, directory: Path, poll_interval: float = 2.0, config: Optional[dict] = None):
+        self.dir = Path(directory)
+        self.config = {**INDEX_DEFAULTS, **(config or {})}
+        self.index_path = self.dir / "index.bin"
+        self.generation_path = self.dir / "generation"
+        self.chunks = ChunkStore(self.dir / "chunks.db")
+        legacy = self.dir / "metadata.json"
+        if legacy.exists() and self.chunks.count() == 0:
+            self.chunks.import_json(legacy)
+        self.poll_interval = poll_interval
+        self._snapshot: Optional[Snapshot] = None
+        self._reload_lock = threading.Lock()
+        self._seen = None
+        self._watcher: Optional[threading.Thread] = None
+
+    def current(self) -> Optional[Snapshot]:
+        """The loaded snapshot (never touches disk). Treat it as read-only."""
+        return self._snapshot
+
+    def _read(self) -> faiss.Index:
+        if not self.config["mmap"]:
+            index = faiss.read_index(str(self.index_path))
+        else:
+            # IVF lists map via IO_FLAG_MMAP; flat / SQ8 codes need IO_FLAG_MMAP_IFC (newer faiss)
+            flag = faiss.IO_FLAG_MMAP
+            if self.config["type"] != "ivf_pq":
+                flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+            index = faiss.read_index(str(self.index_path), flag)
+        if index_kind(index) == "ivf_pq":
+            faiss.extract_index_ivf(index).nprobe = self.config["nprobe"]
+        return index
+
+    def writable(self) -> Optional[faiss.Index]:
+        """A private, mutable copy of the current index for the writer (mapped snapshots are read-only)."""
+        snapshot = self.reload()
+        if snapshot is None:
+            return None
+        return faiss.read_index(str(self.index_path)) if self.config["mmap"] else faiss.clone_index(snapshot.index)
+
+    def _generation(self) -> int:
+        try:
+            return int(self.generation_path.read_text())
+        except (OSError, ValueError):
+            return 0  # no generation file yet (index written before hot reload existed)
+
+    def _signature(self):
+        def mtime(path):
+            try:
+                return path.stat().st_mtime_ns
+            except OSError:
+                return None
+        return mtime(self.generation_path), mtime(self.index_path)
+
+    def reload(self) -> Optional[Snapshot]:
+        """Load the on-disk index if it changed; keeps the previous snapshot on a torn read."""
+        with self._reload_lock:
+            for _ in range(3):
+                signature = self._signature()
+                if signature == self._seen and self._snapshot is not None:
+                    return self._snapshot
+                if not self.index_path.exists():
+                    return self._snapshot
+                generation = self._generation()
+                try:
+                    index = self._read()
+                except Exception:
+                    time.sleep(0.05)
+                    continue
+                # Rows are committed before the index is published; fewer rows means a foreign/torn write
+                if index.ntotal > self.chunks.count() or self._generation() != generation:
+                    time.sleep(0.05)
+                    continue
+                self._snapshot = Snapshot(generation, index)
+                self._seen = signature
+                return self._snapshot
+            return self._snapshot
+
+    def publish(self, index: faiss.Index):
+        """
+        Save `index` atomically and make it current (its chunk rows must already be stored).
+        The caller keeps mutating its own index; searches get a private copy.
+        """
+        with self._reload_lock:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            tmp_index = self.index_path.with_suffix(".bin.tmp")
+            faiss.write_index(index, str(tmp_index))
+            _replace(tmp_index, self.index_path)
+
+            # Generation last: readers that see it also see the index and its rows
+            generation = self._generation() + 1
+            tmp_generation = self.generation_path.with_suffix(".tmp")
+            tmp_generation.write_text(str(generation))
+            _replace(tmp_generation, self.generation_path)
+
+            self._snapshot = Snapshot(generation, self._read() if self.config["mmap"] else faiss.clone_index(index))
+            self._seen = self._signature()
+
+    # ---- writer side: `index` is the writer's private copy (IndexIDMap2 or IndexIVFPQ) ----
+
+    def replace_document(
+        self,
+        index: faiss.Index,
+        name: str,
+        file_hash: str,
+        rows: List[dict],
+        vectors: Optional[np.ndarray],
+        append: bool = False,
+        publish: bool = True
+    ):
+        """
+        Index a (new or changed) document under a fresh id range and drop its previous range
+        (`append`: add a page batch to the document instead).
+        Order: rows + range committed → index published → old rows deleted, so a crash at any
+        point leaves something reconcile() can repair.
+        `publish=False` leaves the change for a later publish() unless a previous range has to
+        be deleted, which is only safe once the index without it is published.
+        """
+        new, previous = self.chunks.put_document(name, file_hash, rows, append=append)
+        if rows:
+            index.add_with_ids(np.asarray(vectors, dtype=np.float32), _ids(new))
+        if previous:
+            index.remove_ids(_ids(previous))
+        if publish or previous:
+            self.publish(index)
+        if previous:
+            self.chunks.delete_range(previous)
+
+    def remove_document(self, index: Optional[faiss.Index], name: str) -> bool:
+        """Purge a deleted document from the index and the chunk store."""
+        previous = self.chunks.forget_document(name)
+        if previous is None:
+            return False
+        if index is not None:
+            index.remove_ids(_ids(previous))
+            self.publish(index)
+        self.chunks.delete_range(previous)
+        return True
+
+    def quantize(self, index: faiss.Index) -> faiss.Index:
+        """
+        Move a flat index to the configured compressed type (same ids, no re-embedding) and
+        publish it, once it holds training_size() vectors; otherwise return it unchanged.
+        """
+        if self.config["type"] == "flat" or index_kind(index) != "flat" or index.ntotal < training_size(self.config):
+            return index
+        index = train_quantized(index, self.config)
+        self.publish(index)
+        return index
+
+    def reconcile(self, index: faiss.Index) -> Set[str]:
+        """
+        Drop vectors and chunk rows outside every document's range (left by an interrupted replace
+        or rebuild) and return the documents whose vectors are missing from `index`, to be re-ingested.
+        """
+        self.chunks.delete_unowned()
+        documents = self.chunks.documents()
+        ids = stored_ids(index)
+        expected = np.concatenate([_ids(r) for r in documents.values()]) if documents else np.empty(0, dtype=np.int64)
+        stray = ids[~np.isin(ids, expected)]
+        if len(stray):
+            index.remove_ids(stray)
+        return {name for name, r in documents.items() if not np.isin(_ids(r), ids).all()}
+
+    def compact(self) -> int:
+        """
+        Remove chunk rows no document owns and reclaim space; returns rows deleted. The index
+        needs no rebuild: remove_ids already frees the vectors (IDMap2 and IVF alike).
+        """
+        return self.chunks.compact()
+
+    def search(self, snapshot: Snapshot, query_vec: np.ndarray, query: str, config: Optional[dict] = None) -> List[dict]:
+        """Chunk rows for the best `top_k` hits: dense only, or dense + BM25 fused with RRF."""
+        return self.search_batch(snapshot, query_vec, [query], config)[0]
+
+    def search_batch(
+        self, snapshot: Snapshot, query_vecs: np.ndarray, queries: List[str], config: Optional[dict] = None
+    ) -> List[List[dict]]:
+        """search() for each query (one row of `query_vecs` each): one multi-row FAISS search, one chunk lookup."""
+        config = {**SEARCH_DEFAULTS, **(config or {})}
+        hybrid = bool(config["keyword_weight"])
+        _, I = snapshot.index.search(
+            np.asarray(query_vecs, dtype=np.float32).reshape(len(queries), -1),
+            config["candidates"] if hybrid else config["top_k"]
+        )
+        rankings = []
+        for query, row in zip(queries, I):
+            ranked = [int(i) for i in row if i >= 0]
+            if hybrid:
+                keyword = self.chunks.keyword_search(query, config["candidates"], config["doc_weight"])
+                ranked = reciprocal_rank_fusion(
+                    [ranked, keyword], [config["vector_weight"], config["keyword_weight"]], config["rrf_k"]
+                )
+            rankings.append(ranked)
+        top_k = config["top_k"]
+        rows = self.lookup({i for ranked in rankings for i in ranked[:top_k]})
+        # Rows removed after this snapshot was published leave gaps: fill them from further down
+        short = [ranked for ranked in rankings if sum(i in rows for i in ranked[:top_k]) < top_k]
+        further = {i for ranked in short for i in ranked[top_k:]} - rows.keys()
+        if further:
+            rows.update(self.lookup(further))
+        return [[rows[i] for i in ranked if i in rows][:top_k] for ranked in rankings]
+
+    def lookup(self, vector_ids: Iterable[int]) -> Dict[int, dict]:
+        """Chunk rows ({doc, chunk_id, chunk}) for the given vector ids."""
+        return self.chunks.get_many(i for i in vector_ids if i >= 0)
+
+    def watch(self):
+        """Poll for changes made by other processes and reload in the background."""
+        if self._watcher is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.poll_interval)
+                if self._signature() != self._seen:
+                    try:
+                        self.reload()
+                    except Exception:
+                        pass  # keep serving the previous snapshot
+
+        self._watcher = threading.Thread(target=run, name="doc-index-watcher", daemon=True)
+        self._watcher.start()
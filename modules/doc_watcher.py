@@ -0,0 +1,173 @@
+# modules/doc_watcher.py → Background Document Indexing
+# Role: Notice changed files in documents/ and index them off the request path.
+
+# Responsibilities:
+
+# Poll the directory (mtime + size); report a file once it has stopped changing for one interval
+
+# Queue changed file names (deduplicated) for a single background indexer thread
+
+# Run the indexer callback in batches; searches keep using the published index meanwhile
+
+# Status for the index_status tool: queue depth, current batch, last indexed time, last error
+
+# Used by: mcp_server_2.py
+
+# modules/doc_watcher.py
+
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Optional, Set, Tuple
+
+Signature = Optional[Tuple[int, int]]  # (mtime_ns, size); None = file absent
+
+
+class DirectoryWatcher:
+    """Polling watcher (no inotify dependency; works the same on macOS, Linux and network drives)."""
+
+    def __init__(self, directory: Path, pattern: str = "*.*"):
+        self.dir = Path(directory)
+        self.pattern = pattern
+        self._committed: Dict[str, Signature] = self.scan()
+        self._previous: Dict[str, Signature] = dict(self._committed)
+
+    def scan(self) -> Dict[str, Signature]:
+        signatures = {}
+        for path in self.dir.glob(self.pattern):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue  # removed between glob and stat
+            if path.is_file():
+                signatures[path.name] = (stat.st_mtime_ns, stat.st_size)
+        return signatures
+
+    def changes(self) -> Set[str]:
+        """Names added, modified or deleted since the last report, once stable across two polls."""
+        current = self.scan()
+        changed = set()
+        for name in current.keys() | self._committed.keys():
+            signature = current.get(name)
+            if signature == self._committed.get(name):
+                continue
+            # Still being written (or copied) if it differs from the previous poll
+            if signature == self._previous.get(name):
+                changed.add(name)
+                if signature is None:
+                    self._committed.pop(name, None)
+                else:
+                    self._committed[name] = signature
+        self._previous = current
+        return changed
+
+
+class BackgroundIndexer:
+    """
+    `index_fn(names)` indexes the given file names (None = full scan) and returns how many
+    files it indexed. It runs on one thread only, so it is the single writer of the document index.
+    """
+
+    def __init__(
+        self,
+        index_fn: Callable[[Optional[Set[str]]], int],
+        watcher: DirectoryWatcher,
+        poll_interval: float = 2.0,
+        log: Callable[[str, str], None] = lambda level, message: None
+    ):
+        self.index_fn = index_fn
+        self.watcher = watcher
+        self.poll_interval = poll_interval
+        self.log = log
+        self._cond = threading.Condition()
+        self._pending: Set[str] = set()
+        self._full_scan = False
+        self._started = False
+        self._batch: Set[str] = set()
+        self._running_full = False
+        self.stats = {
+            "runs": 0,
+            "files_indexed": 0,
+            "last_indexed_at": None,
+            "last_run_seconds": None,
+            "last_error": None,
+        }
+
+    def enqueue(self, names: Set[str]):
+        if not names:
+            return
+        with self._cond:
+            self._pending |= names
+            self._cond.notify()
+
+    def request_full_scan(self):
+        with self._cond:
+            self._full_scan = True
+            self._cond.notify()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Block until nothing is queued or running; False if `timeout` ran out first."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not (self._pending or self._full_scan or self._batch or self._running_full), timeout
+            )
+
+    def start(self, full_scan: bool = True):
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        if full_scan:
+            self.request_full_scan()
+        threading.Thread(target=self._watch, name="doc-watcher", daemon=True).start()
+        threading.Thread(target=self._run, name="doc-indexer", daemon=True).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                changed = self.watcher.changes()
+            except Exception as e:
+                self.log("WARN", f"Document watcher poll failed: {e}")
+                continue
+            if changed:
+                self.log("WATCH", f"Changed: {', '.join(sorted(changed))}")
+                self.enqueue(changed)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._pending or self._full_scan):
+                    self._cond.wait()
+                full = self._full_scan
+                batch = None if full else set(self._pending)
+                self._pending.clear()
+                self._full_scan = False
+                self._batch, self._running_full = batch or set(), full
+
+            start = time.perf_counter()
+            try:
+                indexed = self.index_fn(batch)
+            except Exception as e:
+                self.stats["last_error"] = f"{type(e).__name__}: {e}"
+                self.log("ERROR", f"Background indexing failed: {e}")
+            else:
+                self.stats["last_error"] = None
+                self.stats["files_indexed"] += indexed or 0
+                self.stats["last_run_seconds"] = round(time.perf_counter() - start, 2)
+                self.stats["last_indexed_at"] = datetime.now().isoformat(timespec="seconds")
+            self.stats["runs"] += 1
+            with self._cond:
+                self._batch, self._running_full = set(), False
+                self._cond.notify_all()
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "queue_depth": len(self._pending),
+                "full_scan_queued": self._full_scan,
+                "indexing": bool(self._batch) or self._running_full,
+                "current_batch": "full scan" if self._running_full else sorted(self._batch),
+                **self.stats,
+            }
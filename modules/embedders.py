@@ -0,0 +1,127 @@
+# modules/embedders.py → In-process Embedding Backend
+# Role: Run a HuggingFace embedding model (models.json "huggingface" entries, e.g. nomic) on the CPU, no server.
+
+# Responsibilities:
+
+# Load the model once per process (lazily, on first use) and share it
+
+# Embed in fixed-size batches, several batches at a time on a thread pool
+
+# Optional ONNX Runtime backend and int8 quantization (dynamic for torch, pre-quantized file for ONNX)
+
+# Used by: memory.py (MemoryManager), mcp_server_2.py (document/query embeddings)
+
+# modules/embedders.py
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+ROOT = Path(__file__).parent.parent
+
+
+class LocalEmbedder:
+    """
+    sentence-transformers model on the CPU. `embed()` is thread-safe; large inputs
+    are split into `batch_size` batches and encoded on `workers` threads.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        dimension: Optional[int] = None,
+        batch_size: int = 32,
+        workers: int = 2,
+        backend: str = "torch",        # torch | onnx
+        quantize: bool = False,        # int8
+        threads: Optional[int] = None  # torch intra-op threads (default: torch's choice)
+    ):
+        self.model_name = model
+        self.dimension = dimension
+        self.batch_size = batch_size
+        self.workers = workers
+        self.backend = backend
+        self.quantize = quantize
+        self.threads = threads
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed")
+
+    @property
+    def namespace(self) -> str:
+        """Embedding-cache namespace: vectors differ per backend/quantization, so they never mix."""
+        return f"{self.model_name}/local-{self.backend}{'-int8' if self.quantize else ''}"
+
+    def _load(self):
+        with self._load_lock:
+            if self._model is not None:
+                return self._model
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError as e:
+                raise ImportError(
+                    "Local embeddings need sentence-transformers and einops "
+                    "(pip install sentence-transformers einops; add optimum[onnxruntime] for backend: onnx)"
+                ) from e
+
+            if self.backend == "onnx":
+                # The nomic repos ship an exported graph and an int8-quantized one
+                file_name = "onnx/model_quantized.onnx" if self.quantize else "onnx/model.onnx"
+                model = SentenceTransformer(
+                    self.model_name, device="cpu", trust_remote_code=True,
+                    backend="onnx", model_kwargs={"file_name": file_name}
+                )
+            else:
+                import torch
+                if self.threads:
+                    torch.set_num_threads(self.threads)
+                model = SentenceTransformer(self.model_name, device="cpu", trust_remote_code=True)
+                if self.quantize:
+                    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+            self._model = model
+            return model
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return self._load().encode(
+            texts, batch_size=len(texts), convert_to_numpy=True, show_progress_bar=False
+        ).astype(np.float32)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), dim) float32, in input order."""
+        if not texts:
+            return np.empty((0, self.dimension or 0), dtype=np.float32)
+        self._load()  # once, before the pool fans out
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            return self._encode(batches[0])
+        return np.concatenate(list(self._pool.map(self._encode, batches)))
+
+
+# Process-wide: one loaded model per models.json key
+_embedders: Dict[str, LocalEmbedder] = {}
+_embedders_lock = threading.Lock()
+
+
+def get_embedder(key: str) -> LocalEmbedder:
+    """Shared LocalEmbedder for a `huggingface` entry in config/models.json (e.g. "nomic")."""
+    with _embedders_lock:
+        embedder = _embedders.get(key)
+        if embedder is None:
+            config = json.loads((ROOT / "config" / "models.json").read_text())["models"].get(key)
+            if not config or config.get("type") != "huggingface":
+                raise ValueError(f"No huggingface embedding model '{key}' in config/models.json")
+            embedder = _embedders[key] = LocalEmbedder(
+                model=config["model"],
+                dimension=config.get("embedding_dimension"),
+                batch_size=config.get("batch_size", 32),
+                workers=config.get("workers", 2),
+                backend=config.get("backend", "torch"),
+                quantize=config.get("quantize", False),
+                threads=config.get("threads")
+            )
+        return embedder
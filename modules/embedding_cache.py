@@ -0,0 +1,244 @@
+# modules/embedding_cache.py → Persistent Embedding Cache
+# Role: Content-addressed text → vector cache so the same text is never embedded twice.
+
+# Responsibilities:
+
+# Key vectors by sha256 of the text, namespaced by embedding model
+
+# Store vectors in a fixed-size memory-mapped float32 file (one row per slot), tagged with their key's digest
+
+# Keep key → slot and last-use time in a small SQLite index (safe across processes)
+
+# Evict least-recently-used slots once the file is full; report hit rate
+
+# Used by: memory.py (MemoryManager), mcp_server_2.py (document/query embeddings)
+
+# modules/embedding_cache.py
+
+import atexit
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+ROOT = Path(__file__).parent.parent
+DEFAULT_CACHE_DIR = ROOT / "embedding_cache"
+DEFAULT_CAPACITY = 50_000
+TAG_BYTES = 16  # per-slot key digest (first 128 bits of the sha256 key)
+
+
+def slug(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_") or "default"
+
+
+class EmbeddingCache:
+    """
+    One cache per embedding model. The vectors file is allocated sparse at
+    `capacity` rows on first put, once the embedding dimension is known.
+    """
+
+    def __init__(self, namespace: str, cache_dir: Path = DEFAULT_CACHE_DIR, capacity: int = DEFAULT_CAPACITY):
+        self.namespace = namespace
+        self.dir = Path(cache_dir) / slug(namespace)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.dir / "vectors.f32"
+        self.tags_path = self.dir / "tags.u8"
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            self.dir / "index.db", check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER UNIQUE, last_used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used)")
+
+        meta = dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+        self.capacity = meta.get("capacity", capacity)
+        self.dim: Optional[int] = meta.get("dim")
+        self._vectors: Optional[np.memmap] = None
+        self._tags: Optional[np.memmap] = None
+
+        # Hits only bump last_used in memory; written back in batches
+        self._touched: Dict[str, float] = {}
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _tag(key: str) -> np.ndarray:
+        return np.frombuffer(bytes.fromhex(key[:2 * TAG_BYTES]), dtype=np.uint8)
+
+    def _open_vectors(self, dim: int) -> np.memmap:
+        if self._vectors is None:
+            if self.dim is None:
+                # First writer fixes the layout; later processes adopt it
+                with self._db:
+                    self._db.executemany(
+                        "INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)",
+                        [("dim", dim), ("capacity", self.capacity)]
+                    )
+                meta = dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+                self.dim, self.capacity = meta["dim"], meta["capacity"]
+            mode = "r+" if self.vectors_path.exists() else "w+"
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode=mode, shape=(self.capacity, self.dim))
+            # Which key each slot's vector belongs to. The SQLite index alone can't say: a rolled-back
+            # or interrupted put, or another process evicting the slot mid-read, leaves an entry
+            # pointing at another text's vector. Slots from before the tags existed read as misses.
+            mode = "r+" if self.tags_path.exists() else "w+"
+            self._tags = np.memmap(self.tags_path, dtype=np.uint8, mode=mode, shape=(self.capacity, TAG_BYTES))
+        return self._vectors
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        keys = [self.key(t) for t in texts]
+        with self._lock:
+            if self.dim is None:
+                self.stats["misses"] += len(texts)
+                return [None] * len(texts)
+            vectors = self._open_vectors(self.dim)
+            slots = {}
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                slots.update(rows)
+
+            now = time.time()
+            results = []
+            for k in keys:
+                slot = slots.get(k)
+                vector = None
+                if slot is not None:
+                    # Copy first, then check the tag: a concurrent overwrite clears it before writing
+                    vector = np.array(vectors[slot])
+                    if not np.array_equal(self._tags[slot], self._tag(k)):
+                        vector = None
+                if vector is None:
+                    self.stats["misses"] += 1
+                else:
+                    self.stats["hits"] += 1
+                    self._touched[k] = now
+                results.append(vector)
+            if len(self._touched) >= 256:
+                self._flush_touched()
+            return results
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        return self.get_many([text])[0]
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        if len(texts) == 0:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            store = self._open_vectors(vectors.shape[1])
+            if vectors.shape[1] != self.dim:
+                return  # different model behind the same name; don't poison the cache
+            now = time.time()
+            # IMMEDIATE: slot allocation must not race with another process
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for text, vector in zip(texts, vectors):
+                    k = self.key(text)
+                    row = self._db.execute("SELECT slot FROM entries WHERE key = ?", (k,)).fetchone()
+                    slot = row[0] if row else self._allocate_slot()
+                    if row is None:
+                        self._db.execute(
+                            "INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)", (k, slot, now)
+                        )
+                    # Untagged while the vector is rewritten, so no reader accepts a half-written row
+                    self._tags[slot] = 0
+                    store[slot] = vector
+                    self._tags[slot] = self._tag(k)
+                store.flush()
+                self._tags.flush()
+                self._db.commit()
+            except Exception:
+                self._db.rollback()
+                raise
+
+    def put(self, text: str, vector: np.ndarray):
+        self.put_many([text], np.stack([vector]))
+
+    def _allocate_slot(self) -> int:
+        # Slots stay dense (eviction reuses the victim's slot), so the next free one is the count
+        used = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if used < self.capacity:
+            return used
+        self._flush_touched(commit=False)
+        victim_key, victim_slot = self._db.execute(
+            "SELECT key, slot FROM entries ORDER BY last_used LIMIT 1"
+        ).fetchone()
+        self._db.execute("DELETE FROM entries WHERE key = ?", (victim_key,))
+        self.stats["evictions"] += 1
+        return victim_slot
+
+    def get_or_compute(self, texts: List[str], compute: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Vectors for `texts`, calling `compute` once for the (deduplicated) misses."""
+        cached = self.get_many(texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+        if missing:
+            computed = compute(missing)
+            self.put_many(missing, computed)
+            fresh = dict(zip(missing, computed))
+            cached = [v if v is not None else fresh[t] for t, v in zip(texts, cached)]
+        return np.stack(cached)
+
+    def _flush_touched(self, commit: bool = True):
+        if not self._touched:
+            return
+        if commit:
+            self._db.execute("BEGIN")
+        self._db.executemany(
+            "UPDATE entries SET last_used = ? WHERE key = ?",
+            [(ts, k) for k, ts in self._touched.items()]
+        )
+        self._touched.clear()
+        if commit:
+            self._db.commit()
+
+    def flush(self):
+        with self._lock:
+            self._flush_touched()
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._tags.flush()
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def metrics(self) -> dict:
+        return {**self.stats, "hit_rate": round(self.hit_rate(), 3), "namespace": self.namespace}
+
+
+# Process-wide: one cache object per namespace
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(namespace: str, cache_dir: Path = DEFAULT_CACHE_DIR) -> EmbeddingCache:
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            cache = _caches[namespace] = EmbeddingCache(namespace, cache_dir)
+        return cache
+
+
+@atexit.register
+def _flush_all():
+    for cache in list(_caches.values()):
+        try:
+            cache.flush()
+        except Exception:
+            pass
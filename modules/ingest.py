@@ -0,0 +1,345 @@
+# modules/ingest.py → Document Ingestion Pipeline
+# Role: Turn document files into indexed chunks with every stage running concurrently.
+
+# Responsibilities:
+
+# Extraction (pymupdf4llm / trafilatura / MarkItDown) in a process pool — it is CPU-bound
+
+# Large PDFs stream in page batches: each batch is chunked, embedded and written on its own
+
+# Chunking (captions + LLM semantic merge) and batched embedding on thread pools
+
+# Bounded queues between stages, so a slow stage throttles the ones before it
+
+# A single writer (the calling thread) commits to the index, page batches of a document in order
+
+# Per-stage progress and throughput
+
+# Used by: mcp_server_2.py (process_documents, extract_pdf, extract_webpage)
+
+# modules/ingest.py
+
+import multiprocessing
+import queue
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+ROOT = Path(__file__).parent.parent
+IMAGE_DIR = ROOT / "documents" / "images"
+
+_DONE = object()
+
+# The server's watcher, indexer and HTTP pool threads are running when extraction starts; a forked
+# worker would inherit their locks mid-use. forkserver (spawn where it doesn't exist) starts clean.
+EXTRACT_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+# === EXTRACTION (runs in worker processes: keep imports local and arguments picklable) ===
+
+def pdf_page_count(file_path: str) -> int:
+    import pymupdf
+
+    with pymupdf.open(file_path) as pdf:
+        return pdf.page_count
+
+
+def page_batches(file_path: str, batch: int) -> List[Optional[range]]:
+    """Page ranges to extract a file in: [None] (whole file) unless it is a PDF of more than `batch` pages."""
+    if batch <= 0 or Path(file_path).suffix.lower() != ".pdf":
+        return [None]
+    pages = pdf_page_count(file_path)
+    if pages <= batch:
+        return [None]
+    return [range(start, min(start + batch, pages)) for start in range(0, pages, batch)]
+
+
+def extract_pdf_markdown(file_path: str, pages: Optional[range] = None) -> str:
+    """PDF (or a page range of it) → markdown; images are written to documents/images and linked as images/<name>."""
+    import pymupdf4llm
+
+    IMAGE_DIR.mkdir(parents=True, exist_ok=True)
+    markdown = pymupdf4llm.to_markdown(
+        file_path,
+        pages=list(pages) if pages is not None else None,
+        write_images=True,
+        image_path=str(IMAGE_DIR)
+    )
+    # Re-point image links in the markdown
+    return re.sub(r'!\[\]\((.*?/images/)([^)]+)\)', r'![](images/\2)', markdown.replace("\\", "/"))
+
+
+def extract_webpage_markdown(url: str) -> Optional[str]:
+    """Webpage → markdown, or None if it could not be downloaded."""
+    import trafilatura
+
+    downloaded = trafilatura.fetch_url(url)
+    if not downloaded:
+        return None
+    return trafilatura.extract(
+        downloaded,
+        include_comments=False,
+        include_tables=True,
+        include_images=True,
+        output_format='markdown'
+    ) or ""
+
+
+def extract_markdown(file_path: str, pages: Optional[range] = None) -> str:
+    """Raw markdown for any supported document (image captions are added later, in the chunk stage)."""
+    path = Path(file_path)
+    ext = path.suffix.lower()
+    if ext == ".pdf":
+        return extract_pdf_markdown(file_path, pages)
+    if ext in [".html", ".htm", ".url"]:
+        return extract_webpage_markdown(path.read_text().strip()) or ""
+    from markitdown import MarkItDown
+    return MarkItDown().convert(file_path).text_content
+
+
+# === PIPELINE ===
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    units: int = 0       # chunks for chunk/embed/write, files or page batches for extract
+    busy: float = 0.0    # summed across the stage's workers
+    errors: int = 0
+
+    def summary(self, wall: float) -> str:
+        return (
+            f"{self.name}: {self.items} files, {self.units} units, "
+            f"{self.units / wall if wall else 0:.2f} units/s, busy {self.busy:.1f}s, errors {self.errors}"
+        )
+
+
+@dataclass
+class Document:
+    """One file, or one page batch of a streamed PDF (part 0 replaces the indexed version, later parts append)."""
+    path: Path
+    markdown: str = ""
+    chunks: List[str] = field(default_factory=list)
+    vectors: Optional[np.ndarray] = None
+    pages: Optional[range] = None  # None: the whole file
+    part: int = 0
+    last: bool = True
+    chunk_offset: int = 0          # chunks in the document's earlier parts (set by the writer)
+    failed: bool = False           # this or an earlier part lost content; the document is incomplete
+
+    @property
+    def label(self) -> str:
+        if self.pages is None:
+            return self.path.name
+        return f"{self.path.name} (pages {self.pages.start + 1}-{self.pages.stop})"
+
+
+class IngestPipeline:
+    """
+    extract (processes) → chunk (threads) → embed (threads, batched across files) → write (caller).
+    `chunk(doc)` returns the chunk texts, `embed(texts)` their vectors, `write(doc)` commits one document.
+    With `page_batch`, PDFs longer than that are extracted and written as page-batch parts; `write` gets
+    every part in order (failed parts arrive empty, with `failed` set).
+    """
+
+    def __init__(
+        self,
+        chunk: Callable[[Document], List[str]],
+        embed: Callable[[List[str]], np.ndarray],
+        write: Callable[[Document], None],
+        extract: Callable[[str, Optional[range]], str] = extract_markdown,
+        extract_workers: int = 2,
+        chunk_workers: int = 2,
+        embed_workers: int = 1,
+        embed_batch: int = 64,
+        queue_size: int = 4,
+        page_batch: int = 0,
+        log: Callable[[str, str], None] = lambda level, message: None
+    ):
+        self.extract, self.chunk, self.embed, self.write = extract, chunk, embed, write
+        self.extract_workers = extract_workers
+        self.chunk_workers = chunk_workers
+        self.embed_workers = embed_workers
+        self.embed_batch = embed_batch
+        self.queue_size = queue_size
+        self.page_batch = page_batch
+        self.log = log
+        self.stats: Dict[str, StageStats] = {name: StageStats(name) for name in ("extract", "chunk", "embed", "write")}
+        self._stats_lock = threading.Lock()
+
+    def _record(self, stage: str, units: int, seconds: float, items: int = 1):
+        with self._stats_lock:
+            stats = self.stats[stage]
+            stats.items += items
+            stats.units += units
+            stats.busy += seconds
+
+    def _error(self, stage: str, doc: Document, error: Exception):
+        with self._stats_lock:
+            self.stats[stage].errors += 1
+        self.log("ERROR", f"[{stage}] Failed to process {doc.label}: {error}")
+
+    def _fail(self, stage: str, doc: Document, error: Exception) -> bool:
+        """Record the error; True if the document should still go downstream (an empty streamed part)."""
+        self._error(stage, doc, error)
+        if doc.pages is None:
+            return False
+        # The writer applies parts in order, so a lost part must still arrive
+        doc.failed, doc.markdown, doc.chunks, doc.vectors = True, "", [], None
+        return True
+
+    def _parts(self, files: List[Path]):
+        for path in files:
+            try:
+                batches = page_batches(str(path), self.page_batch)
+            except Exception as e:
+                self._error("extract", Document(path), e)
+                continue
+            for part, pages in enumerate(batches):
+                yield Document(path, pages=pages, part=part, last=part == len(batches) - 1)
+
+    def run(self, files: List[Path]) -> Dict[str, StageStats]:
+        if not files:
+            return self.stats
+        to_chunk: queue.Queue = queue.Queue(self.queue_size)
+        to_embed: queue.Queue = queue.Queue(self.queue_size)
+        to_write: queue.Queue = queue.Queue(self.queue_size)
+        started = time.perf_counter()
+
+        def extract_stage():
+            try:
+                with ProcessPoolExecutor(max_workers=self.extract_workers, mp_context=EXTRACT_CONTEXT) as pool:
+                    pending = {}
+                    parts = self._parts(files)
+                    upcoming = next(parts, None)
+                    while upcoming is not None or pending:
+                        # Bounded look-ahead: never more than 2x workers documents (or page batches) extracted but not queued
+                        while upcoming is not None and len(pending) < 2 * self.extract_workers:
+                            future = pool.submit(self.extract, str(upcoming.path), upcoming.pages)
+                            pending[future] = (upcoming, time.perf_counter())
+                            upcoming = next(parts, None)
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            doc, submitted = pending.pop(future)
+                            try:
+                                doc.markdown = future.result()
+                            except Exception as e:
+                                if self._fail("extract", doc, e):
+                                    to_chunk.put(doc)
+                                continue
+                            self._record("extract", 1, time.perf_counter() - submitted, items=int(doc.last))
+                            to_chunk.put(doc)  # blocks while chunking is behind
+            finally:
+                for _ in range(self.chunk_workers):
+                    to_chunk.put(_DONE)
+
+        def chunk_stage():
+            while (doc := to_chunk.get()) is not _DONE:
+                start = time.perf_counter()
+                if not doc.failed:
+                    try:
+                        doc.chunks = self.chunk(doc)
+                    except Exception as e:
+                        if self._fail("chunk", doc, e):
+                            to_embed.put(doc)
+                        continue
+                    self._record("chunk", len(doc.chunks), time.perf_counter() - start, items=int(doc.last))
+                doc.markdown = ""  # chunks carry the text from here on
+                if doc.chunks or doc.pages is not None:
+                    to_embed.put(doc)
+
+        def embed_stage():
+            finished = False
+            while not finished:
+                doc = to_embed.get()
+                if doc is _DONE:
+                    break
+                # Coalesce small documents into one embedding call
+                batch = [doc]
+                while sum(len(d.chunks) for d in batch) < self.embed_batch:
+                    try:
+                        more = to_embed.get_nowait()
+                    except queue.Empty:
+                        break
+                    if more is _DONE:
+                        finished = True
+                        break
+                    batch.append(more)
+
+                texts = [c for d in batch for c in d.chunks]
+                if not texts:
+                    for d in batch:
+                        to_write.put(d)  # empty page batches: nothing to embed
+                    continue
+                start = time.perf_counter()
+                try:
+                    vectors = self.embed(texts)
+                except Exception as e:
+                    for d in batch:
+                        if self._fail("embed", d, e):
+                            to_write.put(d)
+                    continue
+                self._record("embed", len(vectors), time.perf_counter() - start, items=len(batch))
+                offset = 0
+                for d in batch:
+                    d.vectors = vectors[offset:offset + len(d.chunks)]
+                    offset += len(d.chunks)
+                    to_write.put(d)
+
+        def run_stage(target, workers: int, name: str, then: Callable[[], None]):
+            threads = [threading.Thread(target=target, name=f"ingest-{name}-{i}", daemon=True) for i in range(workers)]
+            for t in threads:
+                t.start()
+
+            def close():
+                for t in threads:
+                    t.join()
+                then()
+            threading.Thread(target=close, name=f"ingest-{name}-close", daemon=True).start()
+
+        threading.Thread(target=extract_stage, name="ingest-extract", daemon=True).start()
+        run_stage(chunk_stage, self.chunk_workers, "chunk", lambda: [to_embed.put(_DONE) for _ in range(self.embed_workers)])
+        run_stage(embed_stage, self.embed_workers, "embed", lambda: to_write.put(_DONE))
+
+        # Single writer: index appends and saves happen on this thread only
+        written = 0
+        held: Dict[Path, Dict[int, Document]] = {}  # parts that overtook an earlier part of their document
+        next_part: Dict[Path, int] = {}
+        offsets: Dict[Path, int] = {}
+        failed = set()
+        while (arrived := to_write.get()) is not _DONE:
+            held.setdefault(arrived.path, {})[arrived.part] = arrived
+            while (doc := held[arrived.path].pop(next_part.get(arrived.path, 0), None)) is not None:
+                next_part[doc.path] = doc.part + 1
+                doc.chunk_offset = offsets.get(doc.path, 0)
+                offsets[doc.path] = doc.chunk_offset + len(doc.chunks)
+                if doc.failed or doc.path in failed:
+                    doc.failed = True
+                    failed.add(doc.path)
+                start = time.perf_counter()
+                try:
+                    self.write(doc)
+                except Exception as e:
+                    self._error("write", doc, e)
+                    failed.add(doc.path)
+                    continue
+                self._record("write", len(doc.chunks), time.perf_counter() - start, items=int(doc.last))
+                written += doc.last
+                self.log(
+                    "PROGRESS",
+                    f"[{written}/{len(files)}] {doc.label}: {len(doc.chunks)} chunks "
+                    f"(queued: chunk {to_chunk.qsize()}, embed {to_embed.qsize()}, write {to_write.qsize()})"
+                )
+
+        wall = time.perf_counter() - started
+        for stats in self.stats.values():
+            self.log("STATS", stats.summary(wall))
+        return self.stats
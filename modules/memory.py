@@ -5,9 +5,17 @@
 
 # Store & retrieve MemoryItem objects
 
-# Use local embedding server (e.g., Ollama) to vectorize input
+# Use local embedding server (e.g., Ollama) or an in-process model (embedders.py) to vectorize input
 
-# Filter memory based on type/tags/session
+# Filter memory based on type/tags/session/scope
+
+# Optionally persist to disk (memory_store.py) and share one instance per process
+
+# Bound growth: item/byte caps, per-type TTL, background index compaction
+
+# Optionally skip or merge near-duplicate memories at write time
+
+# Rows live in a compact columnar table (memory_columns.py); MemoryItem objects are built for results only
 
 # Dependencies:
 
@@ -21,33 +29,303 @@
 
 # modules/memory.py
 
-from typing import List, Optional, Literal
-from pydantic import BaseModel
+from typing import Dict, List, Optional, Literal, Set
+from pydantic import BaseModel, Field
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
+import atexit
+import threading
+import time
 import requests
 import numpy as np
 import faiss
+from modules.singleflight import SingleFlight, make_key
+from modules.embedding_cache import get_embedding_cache, slug
+from modules.memory_store import MemoryStore
+from modules.memory_columns import MemoryColumns
+from modules.embedders import LocalEmbedder, get_embedder
+from modules import vector_index
+
+ROOT = Path(__file__).parent.parent
+
+# Shared across MemoryManager instances so concurrent sessions embedding the same text coalesce
+_embedding_flight = SingleFlight()
 
 
 class MemoryItem(BaseModel):
     text: str
     type: Literal["preference", "tool_output", "fact", "query", "system"] = "fact"
-    timestamp: Optional[str] = datetime.now().isoformat()
+    timestamp: Optional[str] = Field(default_factory=lambda: datetime.now().isoformat())
     tool_name: Optional[str] = None
     user_query: Optional[str] = None
     tags: List[str] = []
     session_id: Optional[str] = None
+    scope: Optional[str] = None  # user/chat the memory belongs to, e.g. "telegram:12345"
+
+
+def _batch_url(embedding_model_url: str) -> Optional[str]:
+    """Ollama's batch endpoint (/api/embed) next to the single-text one (/api/embeddings)."""
+    if embedding_model_url.rstrip("/").endswith("/api/embeddings"):
+        return embedding_model_url.rstrip("/")[:-len("dings")]
+    return None
+
+
+def embedding_source(embedding_model_url: str, model_name: str, embedder: Optional[LocalEmbedder] = None) -> str:
+    """Which vector space a configuration embeds into (cache namespace and store directory)."""
+    if embedder:
+        return embedder.namespace
+    # /api/embed returns normalized vectors and /api/embeddings doesn't, so the endpoint is part of it
+    return f"{model_name}{urlparse(_batch_url(embedding_model_url) or embedding_model_url).path}"
 
 
 class MemoryManager:
-    def __init__(self, embedding_model_url: str, model_name: str = "nomic-embed-text"):
+    # Filtered searches with at most this many candidates are scored exactly over just those vectors
+    EXACT_SEARCH_LIMIT = 4096
+
+    def __init__(
+        self,
+        embedding_model_url: str,
+        model_name: str = "nomic-embed-text",
+        batch_size: int = 64,
+        max_workers: int = 4,
+        use_cache: bool = True,
+        persist_dir: Optional[Path] = None,
+        snapshot_every: int = 50,
+        index_config: Optional[dict] = None,
+        limits: Optional[dict] = None,
+        dedup: Optional[dict] = None,
+        embedder: Optional[LocalEmbedder] = None
+    ):
         self.embedding_model_url = embedding_model_url
+        self.embedding_batch_url = _batch_url(embedding_model_url)
         self.model_name = model_name
-        self.index: Optional[faiss.IndexFlatL2] = None
-        self.data: List[MemoryItem] = []
-        self.embeddings: List[np.ndarray] = []
+        # In-process model instead of the HTTP endpoint (it batches and parallelizes itself)
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        # IndexIDMap2: vector ids are the store's row ids, so filters can address them directly.
+        # Vectors are normalized and scored by inner product (cosine); the inner index type
+        # (flat / hnsw / ivf) follows `index_config` and the store size.
+        self.index_config = vector_index.index_config(index_config)
+        self.index: Optional[faiss.IndexIDMap2] = None
+        # Columnar rows, ordered by id (= oldest first); filters run vectorized over the columns
+        self.rows = MemoryColumns()
+        self._next_id = 1
+
+        # Capacity: max_items / max_bytes caps and per-type TTL (seconds)
+        self.limits = {"max_items": None, "max_bytes": None, "ttl_seconds": {}, "compact_interval": 300, **(limits or {})}
+        # Evicted ids still present in the index until the next compaction
+        self._tombstones: Set[int] = set()
+
+        # Near-duplicates: cosine >= threshold against a memory of the same type and scope.
+        # "skip" keeps the existing memory; "merge" replaces it with the new one (tags unioned).
+        self.dedup = {"threshold": None, "mode": "skip", **(dedup or {})}
+        self.dedup_stats = {"skipped": 0, "merged": 0}
+
+        self.embedding_source = embedding_source(embedding_model_url, model_name, embedder)
+        self.cache = get_embedding_cache(self.embedding_source) if use_cache else None
+
+        # Shared between concurrent AgentLoops when persistent
+        self._lock = threading.RLock()
+        self.store = MemoryStore(persist_dir) if persist_dir else None
+        self.snapshot_every = snapshot_every
+        self._unsaved = 0
+        self._compactor: Optional[threading.Thread] = None
+        self._wake = threading.Event()  # ask the compactor for an early pass (index promotion)
+        self._compacting = False
+        self._promoter: Optional[threading.Thread] = None
+        if self.store:
+            self._load()
+            # Only long-lived (persistent, shared) managers get a background compactor
+            self._start_compactor()
+
+    def _load(self):
+        """Rebuild in-memory state from the store; replay rows the index snapshot missed."""
+        index = self.store.load_index()
+        # The newest row has the current model's dimension
+        dim = self.store.latest_dim()
+        if not isinstance(index, faiss.IndexIDMap2) or index.metric_type != faiss.METRIC_INNER_PRODUCT or index.d != dim:
+            index = None  # missing, an older L2/positional snapshot or another model's: rebuild from rows
+        # Not just ids above the snapshot's highest: another process sharing the store may have
+        # committed lower ids that this process's snapshot never saw
+        snapshot_ids = faiss.vector_to_array(index.id_map) if index is not None else np.empty(0, dtype=np.int64)
+        covered = set(snapshot_ids.tolist())
+
+        pending_ids, pending = [], []
+        skipped = 0
+        for row_id, row, vector in self.store.rows():
+            if len(vector) != dim:
+                skipped += 1  # embedded by another model (a store from before per-model directories)
+                continue
+            self._register(row_id, MemoryItem(**row), vector.nbytes)
+            if row_id not in covered:
+                pending_ids.append(row_id)
+                pending.append(vector)
+        if skipped:
+            print(f"[memory] ⚠️ Ignoring {skipped} stored memories with a different embedding dimension")
+
+        self.index = index
+        if index is not None:
+            # Rows deleted after the snapshot was taken
+            self._tombstones.update(int(i) for i in snapshot_ids if int(i) not in self.rows)
+        if pending:
+            self._index_add(vector_index.normalize(np.stack(pending)), pending_ids)
+        self.enforce_limits()
+        if pending or self._tombstones:
+            self.compact()
+
+    def _index_add(self, vectors: np.ndarray, ids: List[int]):
+        """Add normalized vectors, creating the index if needed; promotion is left to compact()."""
+        if self.index is None:
+            kind = vector_index.choose_kind(self.index_config, len(ids))
+            # IVF needs training data; start flat and promote once vectors exist
+            self.index = vector_index.make_index("flat" if kind == "ivf" else kind, vectors.shape[1], self.index_config)
+        self.index.add_with_ids(vectors, np.array(ids, dtype=np.int64))
+
+        if self._promotion_due():
+            self._schedule_compaction()
+
+    def _target_kind(self) -> str:
+        """Index type for the current size; automatic promotion never moves back down."""
+        kind = vector_index.choose_kind(self.index_config, len(self.rows))
+        current = vector_index.kind_of(self.index)
+        return kind if vector_index.RANK[kind] >= vector_index.RANK[current] else current
+
+    def _promotion_due(self) -> bool:
+        with self._lock:
+            return self.index is not None and self._target_kind() != vector_index.kind_of(self.index)
+
+    def _schedule_compaction(self):
+        """
+        Promotion trains / builds a whole index (seconds at 20k+ vectors), so it never runs in
+        the caller of add(): wake the compactor, or run one compaction on a short-lived thread.
+        """
+        if self._compactor is not None:
+            self._wake.set()
+        elif self._promoter is None or not self._promoter.is_alive():
+            self._promoter = threading.Thread(target=self._compact_quietly, name="memory-promote", daemon=True)
+            self._promoter.start()
+
+    def _register(self, item_id: int, item: MemoryItem, vector_bytes: int):
+        self.rows.append(item_id, item, vector_bytes)
+        self._next_id = max(self._next_id, item_id + 1)
+
+    def evict(self, ids: List[int]):
+        """Drop memories now; their vectors leave the index at the next compaction."""
+        with self._lock:
+            ids = [int(i) for i in ids if int(i) in self.rows]
+            if not ids:
+                return
+            if self.store:
+                self.store.delete(ids)
+            self.rows.delete(ids)
+            self._tombstones.update(ids)
+
+    def enforce_limits(self):
+        """Expire items past their type's TTL, then evict oldest-first down to the caps."""
+        with self._lock:
+            now = time.time()
+            for item_type, ttl in (self.limits["ttl_seconds"] or {}).items():
+                if ttl:
+                    self.evict(self.rows.match(type_filter=item_type, created_before=now - ttl))
+
+            max_items, max_bytes = self.limits["max_items"], self.limits["max_bytes"]
+            if not self._over_limits():
+                return
+            ids = self.rows.live_ids()  # oldest first
+            drop = 0
+            if max_items:
+                drop = max(drop, len(ids) - max_items)
+            if max_bytes and self.rows.live_bytes > max_bytes:
+                # Smallest prefix of oldest rows whose removal gets under the byte cap
+                freed = np.cumsum(self.rows.sizes(ids))
+                drop = max(drop, int(np.searchsorted(freed, self.rows.live_bytes - max_bytes)) + 1)
+            self.evict(ids[:drop])
+
+    def compact(self):
+        """
+        Rebuild the index without evicted vectors, promoted to the type its size calls for. The vectors are copied under the
+        lock, the new index is trained and filled outside it so adds and retrieval keep
+        working, and additions made meanwhile are carried over before the swap.
+        """
+        with self._lock:
+            if self.index is None or self._compacting:
+                return  # one pass at a time; the running one picks up this state too
+            self._compacting = True
+            old = self.index
+            dropped = set(self._tombstones)
+            kind = self._target_kind()
+            seen = self._next_id
+            self.rows.compact()
+            # add() writes to `old` until the swap; FAISS isn't safe for a concurrent add and read
+            ids, vectors = vector_index.all_vectors(old, drop_ids=dropped)
+
+        try:
+            fresh = vector_index.build(kind, old.d, self.index_config, ids, vectors)
+            del vectors
+            with self._lock:
+                late = [i for i in range(seen, self._next_id) if i in self.rows]
+                if late:
+                    fresh.add_with_ids(np.stack([old.reconstruct(i) for i in late]), np.array(late, dtype=np.int64))
+                self.index = fresh
+                self._tombstones -= dropped
+                self.flush()
+        finally:
+            self._compacting = False
+
+    def _compact_quietly(self):
+        try:
+            self.compact()
+        except Exception as e:
+            print(f"[memory] ⚠️ Compaction failed: {e}")
+
+    def _start_compactor(self):
+        interval = self.limits["compact_interval"]
+        if not interval:
+            return
+
+        def run():
+            while True:
+                self._wake.wait(interval)
+                self._wake.clear()
+                try:
+                    self.enforce_limits()
+                    if self._tombstones or self._promotion_due():
+                        self.compact()
+                except Exception as e:
+                    print(f"[memory] ⚠️ Compaction failed: {e}")
+
+        self._compactor = threading.Thread(target=run, name="memory-compactor", daemon=True)
+        self._compactor.start()
+
+    def flush(self):
+        """Write an index snapshot (no-op for in-memory managers)."""
+        with self._lock:
+            if self.store and self.index is not None:
+                self.store.save_index(self.index)
+            self._unsaved = 0
 
     def _get_embedding(self, text: str) -> np.ndarray:
+        if self.cache is not None:
+            cached = self.cache.get(text)
+            if cached is not None:
+                return cached
+        key = make_key(self.embedding_source, text)
+        return _embedding_flight.do(key, self._fetch_embedding, text)
+
+    def _fetch_embedding(self, text: str) -> np.ndarray:
+        embedding = self._request_embedding(text)
+        if self.cache is not None:
+            self.cache.put(text, embedding)
+        return embedding
+
+    def _request_embedding(self, text: str) -> np.ndarray:
+        # Same endpoint as bulk_add when available, so single and batched vectors are comparable
+        if self.embedder or self.embedding_batch_url:
+            return self._request_embeddings([text])[0]
+
         response = requests.post(
             self.embedding_model_url,
             json={"model": self.model_name, "prompt": text}
@@ -55,15 +333,85 @@ class MemoryManager:
         response.raise_for_status()
         return np.array(response.json()["embedding"], dtype=np.float32)
 
+    def _request_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Embed a batch of texts in one request; falls back to one request per text."""
+        if self.embedder:
+            return self.embedder.embed(texts)
+        if not self.embedding_batch_url:
+            return np.stack([self._request_embedding(text) for text in texts])
+
+        response = requests.post(
+            self.embedding_batch_url,
+            json={"model": self.model_name, "input": texts}
+        )
+        response.raise_for_status()
+        return np.array(response.json()["embeddings"], dtype=np.float32)
+
+    def _get_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Embed many texts, only requesting the ones not already in the cache."""
+        if self.cache is not None:
+            return self.cache.get_or_compute(texts, self._compute_embeddings)
+        return self._compute_embeddings(texts)
+
+    def _compute_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Fixed-size batches, run concurrently on a bounded pool."""
+        if self.embedder:
+            return self.embedder.embed(texts)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            return self._request_embeddings(batches[0])
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return np.concatenate(list(pool.map(self._request_embeddings, batches)))
+
+    def _add_vectors(self, vectors: np.ndarray, items: List[MemoryItem]):
+        with self._lock:
+            # Rows hit disk first; the index snapshot can always be rebuilt from them
+            if self.store:
+                ids = self.store.append([item.model_dump() for item in items], vectors)
+            else:
+                ids = list(range(self._next_id, self._next_id + len(items)))
+
+            for item_id, item in zip(ids, items):
+                self._register(item_id, item, vectors[0].nbytes)
+            self._index_add(vector_index.normalize(vectors), ids)
+
+            if self._over_limits():
+                self.enforce_limits()
+
+            self._unsaved += len(items)
+            if self.store and self._unsaved >= self.snapshot_every:
+                self.flush()
+
+    def _over_limits(self) -> bool:
+        max_items, max_bytes = self.limits["max_items"], self.limits["max_bytes"]
+        return bool((max_items and len(self.rows) > max_items) or (max_bytes and self.rows.live_bytes > max_bytes))
+
     def add(self, item: MemoryItem):
         embedding = self._get_embedding(item.text)
-        self.embeddings.append(embedding)
-        self.data.append(item)
+        with self._lock:
+            # Check and insert under one lock so concurrent loops can't both add the same memory
+            duplicate = self._find_duplicate(embedding, item) if self.dedup["threshold"] is not None else None
+            if duplicate is not None:
+                if self.dedup["mode"] != "merge":
+                    self.dedup_stats["skipped"] += 1
+                    return
+                existing = self.rows.get(duplicate, MemoryItem)
+                item = item.model_copy(update={"tags": list(dict.fromkeys(existing.tags + item.tags))})
+                self.evict([duplicate])
+                self.dedup_stats["merged"] += 1
+            self._add_vectors(np.stack([embedding]), [item])
 
-        # Init or add to index
+    def _find_duplicate(self, embedding: np.ndarray, item: MemoryItem) -> Optional[int]:
+        """Id of the closest same-type, same-scope memory if it is within the dedup threshold."""
         if self.index is None:
-            self.index = faiss.IndexFlatL2(len(embedding))
-        self.index.add(np.stack([embedding]))
+            return None
+        candidates = self.rows.match(type_filter=item.type, scope_filter=item.scope, exact_scope=True)
+        if len(candidates) == 0:
+            return None
+        ids, scores = self._search(vector_index.normalize(embedding), candidates, 1)
+        if len(ids) and scores[0] >= self.dedup["threshold"]:
+            return int(ids[0])
+        return None
 
     def retrieve(
         self,
@@ -71,33 +419,125 @@ class MemoryManager:
         top_k: int = 3,
         type_filter: Optional[str] = None,
         tag_filter: Optional[List[str]] = None,
-        session_filter: Optional[str] = None
+        session_filter: Optional[str] = None,
+        scope_filter: Optional[str] = None
     ) -> List[MemoryItem]:
-        if not self.index or len(self.data) == 0:
+        if not self.index or len(self.rows) == 0:
             return []
 
-        query_vec = self._get_embedding(query).reshape(1, -1)
-        D, I = self.index.search(query_vec, top_k * 2)  # overfetch for filtering
+        query_vec = vector_index.normalize(self._get_embedding(query))
+        with self._lock:
+            filtered = any((type_filter and type_filter != "all", tag_filter, session_filter, scope_filter))
+            candidates = self.rows.match(
+                type_filter=type_filter if type_filter != "all" else None,
+                tag_filter=tag_filter,
+                session_filter=session_filter,
+                scope_filter=scope_filter
+            ) if filtered else None
+            if candidates is not None and len(candidates) == 0:
+                return []
 
-        results = []
-        for idx in I[0]:
-            if idx >= len(self.data):
-                continue
-            item = self.data[idx]
+            ids, _ = self._search(query_vec, candidates, top_k)
+            # Only the final top-k rows are turned into MemoryItem objects
+            items = (self.rows.get(int(i), MemoryItem) for i in ids)
+            return [item for item in items if item is not None]
 
-            if type_filter and item.type != type_filter:
-                continue
-            if tag_filter and not any(tag in item.tags for tag in tag_filter):
-                continue
-            if session_filter and item.session_id != session_filter:
-                continue
+    def _search(self, query_vec: np.ndarray, candidates: Optional[np.ndarray], top_k: int) -> tuple[np.ndarray, np.ndarray]:
+        """(ids, cosine scores), best first; `candidates` restricts the search to those ids."""
+        if candidates is not None and len(candidates) <= self.EXACT_SEARCH_LIMIT:
+            return self._exact_search(query_vec[0], candidates, top_k)
 
-            results.append(item)
-            if len(results) >= top_k:
-                break
+        if candidates is None:
+            # Evicted-but-not-yet-compacted vectors must not take result slots
+            evicted = faiss.IDSelectorBatch(np.fromiter(self._tombstones, dtype=np.int64)) if self._tombstones else None
+            selector = faiss.IDSelectorNot(evicted) if evicted is not None else None
+        else:
+            # Filter inside FAISS: only selected ids are scored, so top_k is always filled
+            selector = faiss.IDSelectorBatch(candidates)
+        params = vector_index.search_params(self.index, self.index_config, selector)
+        D, I = self.index.search(query_vec, top_k, params=params)
+        found = I[0] >= 0
+        return I[0][found], D[0][found]
 
-        return results
+    def _exact_search(self, query_vec: np.ndarray, ids: np.ndarray, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Brute-force over just the candidate vectors: cost depends on the filter, not the store size."""
+        vectors = np.stack([self.index.reconstruct(int(i)) for i in ids])
+        scores = vectors @ query_vec  # cosine: both sides are normalized
+        k = min(top_k, len(ids))
+        best = np.argpartition(-scores, k - 1)[:k]
+        order = best[np.argsort(-scores[best])]
+        return ids[order], scores[order]
 
     def bulk_add(self, items: List[MemoryItem]):
-        for item in items:
-            self.add(item)
+        if not items:
+            return
+        vectors = self._get_embeddings([item.text for item in items])
+        self._add_vectors(vectors, items)
+
+
+# Persistent managers are shared by every AgentLoop in the process
+_shared: Dict[tuple, MemoryManager] = {}
+_shared_lock = threading.Lock()
+
+
+def get_memory_manager(memory_config: dict) -> MemoryManager:
+    """
+    MemoryManager for the profile's `memory` section. With `persist_dir` set, one
+    on-disk store is loaded once and shared; without it, each call gets a fresh
+    in-memory manager (previous per-query behaviour).
+    """
+    # "http": Ollama at embedding_url; otherwise a models.json huggingface key run in-process
+    backend = memory_config.get("embedding_backend", "http")
+    embedder = get_embedder(backend) if backend != "http" else None
+
+    def build(persist_dir=None):
+        return MemoryManager(
+            embedding_model_url=memory_config["embedding_url"],
+            model_name=memory_config["embedding_model"],
+            batch_size=memory_config.get("embedding_batch_size", 64),
+            max_workers=memory_config.get("embedding_workers", 4),
+            persist_dir=persist_dir,
+            snapshot_every=memory_config.get("snapshot_every", 50),
+            index_config=memory_config.get("index"),
+            limits=memory_config.get("limits"),
+            dedup=memory_config.get("dedup"),
+            embedder=embedder
+        )
+
+    if not memory_config.get("persist_dir"):
+        return build()
+
+    # Vectors from different models (or endpoints) can't share an index: one store per vector space
+    root = (ROOT / memory_config["persist_dir"]).resolve()
+    persist_dir = root / slug(embedding_source(memory_config["embedding_url"], memory_config["embedding_model"], embedder))
+    _adopt_legacy_store(root / backend if embedder else root, persist_dir)
+    key = (str(persist_dir), backend, memory_config["embedding_url"], memory_config["embedding_model"])
+    with _shared_lock:
+        manager = _shared.get(key)
+        if manager is None:
+            manager = _shared[key] = build(persist_dir)
+        return manager
+
+
+def _adopt_legacy_store(legacy: Path, persist_dir: Path):
+    """Move a store from before per-model directories into the current model's (once, if it has none)."""
+    if not (legacy / "memory.db").exists():
+        return
+    try:
+        persist_dir.mkdir(parents=True)
+    except FileExistsError:
+        return  # already has a store (or another process is adopting it)
+    for name in ("memory.db", "memory.db-wal", "memory.db-shm", "index.faiss"):
+        try:
+            (legacy / name).rename(persist_dir / name)
+        except FileNotFoundError:
+            pass
+
+
+@atexit.register
+def _flush_shared():
+    for manager in list(_shared.values()):
+        try:
+            manager.flush()
+        except Exception:
+            pass
@@ -0,0 +1,245 @@
+# modules/memory_columns.py → Columnar Memory Rows
+# Role: Compact in-memory table behind MemoryManager instead of one pydantic object per memory.
+
+# Responsibilities:
+
+# One numpy column per field: ids, integer timestamps, byte sizes, interned codes
+
+# Tool names, session ids, scopes, user queries and tag sets interned once (re-interned from live rows on compaction)
+
+# Memory text kept in a single UTF-8 arena (offset + length per row)
+
+# Vectorized filtering (type/tag/session/scope/age) over the columns
+
+# Rows become MemoryItem objects only when returned (final top-k)
+
+# Used by: memory.py (MemoryManager)
+
+# modules/memory_columns.py
+
+from datetime import datetime
+from typing import Dict, Hashable, Iterable, List, Optional
+
+import numpy as np
+
+TYPES = ("preference", "tool_output", "fact", "query", "system")
+TYPE_CODES = {name: code for code, name in enumerate(TYPES)}
+STRING_COLUMNS = ("tool", "session", "scope", "query")
+
+
+class Interner:
+    """value ↔ small int; code 0 is reserved for None."""
+
+    def __init__(self):
+        self.values: List[Optional[Hashable]] = [None]
+        self.codes: Dict[Optional[Hashable], int] = {None: 0}
+
+    def code(self, value: Optional[Hashable]) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value: Hashable) -> int:
+        """Existing code, or -1 if the value was never seen (matches no row)."""
+        return self.codes.get(value, -1)
+
+    def retain(self, used: np.ndarray) -> np.ndarray:
+        """Forget every value whose code isn't in `used`; returns the old → new code map."""
+        kept = np.unique(np.append(used, 0))  # None stays code 0
+        remap = np.zeros(len(self.values), dtype=np.int32)
+        remap[kept] = np.arange(len(kept), dtype=np.int32)
+        self.values = [self.values[code] for code in kept]
+        self.codes = {value: code for code, value in enumerate(self.values)}
+        return remap
+
+
+class _Column:
+    """Append-only numpy column with amortized doubling."""
+
+    def __init__(self, dtype, capacity: int = 1024):
+        self.data = np.empty(capacity, dtype=dtype)
+        self.n = 0
+
+    def append(self, value):
+        if self.n == len(self.data):
+            grown = np.empty(len(self.data) * 2, dtype=self.data.dtype)
+            grown[:self.n] = self.data[:self.n]
+            self.data = grown
+        self.data[self.n] = value
+        self.n += 1
+
+    def view(self) -> np.ndarray:
+        return self.data[:self.n]
+
+    def replace(self, values: np.ndarray):
+        self.data = np.array(values, dtype=self.data.dtype)
+        if len(self.data) == 0:
+            self.data = np.empty(1024, dtype=self.data.dtype)
+        self.n = len(values)
+
+
+class MemoryColumns:
+    def __init__(self):
+        self.columns = {
+            "id": _Column(np.int64),
+            "created": _Column(np.int64),     # epoch seconds
+            "size": _Column(np.int64),        # text + vector bytes, for byte caps
+            "type": _Column(np.int8),
+            "tool": _Column(np.int32),
+            "session": _Column(np.int32),
+            "scope": _Column(np.int32),
+            "query": _Column(np.int32),       # user_query, repeated across a session's tool outputs
+            "tags": _Column(np.int32),        # interned tag tuple
+            "text_start": _Column(np.int64),
+            "text_len": _Column(np.int32),
+            "alive": _Column(np.bool_),
+        }
+        self.arena = bytearray()
+        self.strings = Interner()
+        self.tagsets = Interner()
+        self.live = 0
+        self.live_bytes = 0
+
+    def col(self, name: str) -> np.ndarray:
+        return self.columns[name].view()
+
+    # ---- writes ----
+
+    def append(self, item_id: int, item, vector_bytes: int):
+        """Ids must be increasing (store row ids / manager counter)."""
+        text = item.text.encode("utf-8")
+        size = len(text) + vector_bytes
+        values = {
+            "id": item_id,
+            "created": int(_epoch(item.timestamp)),
+            "size": size,
+            "type": TYPE_CODES[item.type],
+            "tool": self.strings.code(item.tool_name),
+            "session": self.strings.code(item.session_id),
+            "scope": self.strings.code(item.scope),
+            "query": self.strings.code(item.user_query),
+            "tags": self.tagsets.code(tuple(item.tags)),
+            "text_start": len(self.arena),
+            "text_len": len(text),
+            "alive": True,
+        }
+        for name, value in values.items():
+            self.columns[name].append(value)
+        self.arena += text
+        self.live += 1
+        self.live_bytes += size
+
+    def delete(self, ids: Iterable[int]):
+        rows = self._rows(ids)
+        if len(rows) == 0:
+            return
+        alive = self.columns["alive"].data
+        rows = rows[alive[rows]]
+        alive[rows] = False
+        self.live -= len(rows)
+        self.live_bytes -= int(self.col("size")[rows].sum())
+
+    def compact(self):
+        """Drop dead rows, their text from the arena and the strings / tag sets only they used."""
+        keep = np.nonzero(self.col("alive"))[0]
+        if len(keep) == self.columns["id"].n:
+            return
+        starts, lengths = self.col("text_start")[keep], self.col("text_len")[keep]
+        arena = bytearray()
+        new_starts = np.empty(len(keep), dtype=np.int64)
+        for i, (start, length) in enumerate(zip(starts, lengths)):
+            new_starts[i] = len(arena)
+            arena += self.arena[start:start + length]
+        for name, column in self.columns.items():
+            column.replace(new_starts if name == "text_start" else column.view()[keep])
+        self.arena = arena
+
+        # user_query holds whole prompts: without this, evicted rows would keep them alive
+        remap = self.strings.retain(np.concatenate([self.col(name) for name in STRING_COLUMNS]))
+        for name in STRING_COLUMNS:
+            self.columns[name].replace(remap[self.col(name)])
+        remap = self.tagsets.retain(self.col("tags"))
+        self.columns["tags"].replace(remap[self.col("tags")])
+
+    # ---- reads ----
+
+    def _rows(self, ids: Iterable[int]) -> np.ndarray:
+        """Row positions of `ids` that exist (ids are sorted, so this is a binary search)."""
+        ids = np.asarray(ids if isinstance(ids, np.ndarray) else list(ids), dtype=np.int64)
+        all_ids = self.col("id")
+        rows = np.searchsorted(all_ids, ids)
+        found = rows < len(all_ids)
+        found[found] = all_ids[rows[found]] == ids[found]
+        return rows[found]
+
+    def __len__(self) -> int:
+        return self.live
+
+    def __contains__(self, item_id: int) -> bool:
+        rows = self._rows([item_id])
+        return len(rows) == 1 and bool(self.col("alive")[rows[0]])
+
+    def live_ids(self) -> np.ndarray:
+        """Alive ids, oldest first."""
+        return self.col("id")[self.col("alive")]
+
+    def match(
+        self,
+        type_filter: Optional[str] = None,
+        tag_filter: Optional[List[str]] = None,
+        session_filter: Optional[str] = None,
+        scope_filter: Optional[str] = None,
+        created_before: Optional[float] = None,
+        exact_scope: bool = False
+    ) -> np.ndarray:
+        """Ids of alive rows satisfying every given filter (`exact_scope`: a None scope matches only unscoped rows)."""
+        mask = self.col("alive").copy()
+        if type_filter:
+            mask &= self.col("type") == TYPE_CODES.get(type_filter, -1)
+        if tag_filter:
+            wanted = set(tag_filter)
+            codes = [code for code, tags in enumerate(self.tagsets.values) if tags and wanted.intersection(tags)]
+            mask &= np.isin(self.col("tags"), codes)
+        if session_filter:
+            mask &= self.col("session") == self.strings.lookup(session_filter)
+        if scope_filter or exact_scope:
+            mask &= self.col("scope") == self.strings.lookup(scope_filter)
+        if created_before is not None:
+            mask &= self.col("created") < created_before
+        return self.col("id")[mask]
+
+    def sizes(self, ids: np.ndarray) -> np.ndarray:
+        return self.col("size")[self._rows(ids)]
+
+    def get(self, item_id: int, item_cls):
+        """Materialize one row as `item_cls` (MemoryItem), or None if missing/evicted."""
+        rows = self._rows([item_id])
+        if len(rows) == 0 or not self.col("alive")[rows[0]]:
+            return None
+        r = rows[0]
+        start, length = int(self.col("text_start")[r]), int(self.col("text_len")[r])
+        s = self.strings.values
+        return item_cls(
+            text=self.arena[start:start + length].decode("utf-8"),
+            type=TYPES[self.col("type")[r]],
+            timestamp=datetime.fromtimestamp(int(self.col("created")[r])).isoformat(),
+            tool_name=s[self.col("tool")[r]],
+            user_query=s[self.col("query")[r]],
+            tags=list(self.tagsets.values[self.col("tags")[r]] or ()),
+            session_id=s[self.col("session")[r]],
+            scope=s[self.col("scope")[r]],
+        )
+
+    def nbytes(self) -> int:
+        """Approximate footprint: columns + arena + interned strings (tag sets excluded)."""
+        strings = sum(len(value) for value in self.strings.values if isinstance(value, str))
+        return sum(c.data.nbytes for c in self.columns.values()) + len(self.arena) + strings
+
+
+def _epoch(timestamp: Optional[str]) -> float:
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return datetime.now().timestamp()
@@ -0,0 +1,114 @@
+# modules/memory_store.py → Persistent Memory Backend
+# Role: On-disk home for MemoryManager so memories survive across sessions and restarts.
+
+# Responsibilities:
+
+# SQLite table of memory rows (metadata + raw embedding) — the source of truth
+
+# FAISS index snapshot next to it, written atomically (tmp file + rename)
+
+# Incremental appends: rows are committed before the in-memory index is touched
+
+# On load, rows missing from the snapshot are replayed into the index
+
+# Used by: memory.py (MemoryManager)
+
+# modules/memory_store.py
+
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS memories (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,  -- never reuse ids of evicted rows
+    text        TEXT NOT NULL,
+    type        TEXT NOT NULL,
+    timestamp   TEXT,
+    tool_name   TEXT,
+    user_query  TEXT,
+    tags        TEXT NOT NULL DEFAULT '[]',
+    session_id  TEXT,
+    scope       TEXT,
+    vector      BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS memories_scope ON memories (scope);
+"""
+
+COLUMNS = ("text", "type", "timestamp", "tool_name", "user_query", "tags", "session_id", "scope")
+
+
+class MemoryStore:
+    def __init__(self, directory: Path):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.dir / "index.faiss"
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.dir / "memory.db", check_same_thread=False)
+        # WAL + FULL sync: a committed row survives a crash even if the snapshot doesn't
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    def append(self, rows: List[dict], vectors: np.ndarray) -> List[int]:
+        """Insert rows with their vectors in one transaction; returns the new row ids."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        ids = []
+        with self._lock, self._db:
+            for row, vector in zip(rows, vectors):
+                values = [json.dumps(row[c]) if c == "tags" else row.get(c) for c in COLUMNS]
+                cursor = self._db.execute(
+                    f"INSERT INTO memories ({', '.join(COLUMNS)}, vector) VALUES ({', '.join('?' * len(COLUMNS))}, ?)",
+                    (*values, vector.tobytes())
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def rows(self) -> Iterator[Tuple[int, dict, np.ndarray]]:
+        """All rows in insertion (id) order."""
+        cursor = self._db.execute(
+            f"SELECT id, {', '.join(COLUMNS)}, vector FROM memories ORDER BY id"
+        )
+        for record in cursor:
+            row = dict(zip(COLUMNS, record[1:-1]))
+            row["tags"] = json.loads(row["tags"] or "[]")
+            yield record[0], row, np.frombuffer(record[-1], dtype=np.float32)
+
+    def delete(self, ids: List[int]):
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM memories WHERE id = ?", [(int(i),) for i in ids])
+
+    def count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM memories").fetchone()[0]
+
+    def latest_dim(self) -> Optional[int]:
+        """Embedding dimension of the newest row (None when empty)."""
+        row = self._db.execute("SELECT length(vector) FROM memories ORDER BY id DESC LIMIT 1").fetchone()
+        return row[0] // np.dtype(np.float32).itemsize if row else None
+
+    def load_index(self) -> Optional[faiss.Index]:
+        if not self.index_path.exists():
+            return None
+        try:
+            return faiss.read_index(str(self.index_path))
+        except Exception:
+            return None  # torn/corrupt snapshot: caller rebuilds from rows
+
+    def save_index(self, index: faiss.Index):
+        """Atomic snapshot: readers see either the old or the new file, never a partial one."""
+        tmp = self.index_path.with_suffix(".faiss.tmp")
+        faiss.write_index(index, str(tmp))
+        with open(tmp, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, self.index_path)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
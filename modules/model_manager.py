@@ -1,10 +1,16 @@
 import os
 import json
 import yaml
+import asyncio
+import time
+import threading
 import requests
 from pathlib import Path
-from google import genai
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 from dotenv import load_dotenv
+from modules.singleflight import AsyncSingleFlight, make_key
+from modules.rate_limit import AdaptiveLimiter, is_rate_limited
 
 load_dotenv()
 
@@ -12,48 +18,207 @@ ROOT = Path(__file__).parent.parent
 MODELS_JSON = ROOT / "config" / "models.json"
 PROFILE_YAML = ROOT / "config" / "profiles.yaml"
 
+
+def _is_cache_too_small(error: Exception) -> bool:
+    """Gemini rejects cached content under its minimum token count; that never changes for a prefix."""
+    message = str(error).lower()
+    return "too small" in message or "min_total_token_count" in message
+
+
+@lru_cache(maxsize=None)
+def _load_models_config() -> dict:
+    return json.loads(MODELS_JSON.read_text())
+
+
+@lru_cache(maxsize=None)
+def _load_profile() -> dict:
+    return yaml.safe_load(PROFILE_YAML.read_text())
+
+
 class ModelManager:
-    def __init__(self):
-        self.config = json.loads(MODELS_JSON.read_text())
-        self.profile = yaml.safe_load(PROFILE_YAML.read_text())
+    def __init__(self, text_model_key: Optional[str] = None):
+        self.config = _load_models_config()
+        self.profile = _load_profile()
 
-        self.text_model_key = self.profile["llm"]["text_generation"]
+        self.text_model_key = text_model_key or self.profile["llm"]["text_generation"]
         self.model_info = self.config["models"][self.text_model_key]
         self.model_type = self.model_info["type"]
 
         # ✅ Gemini initialization (your style)
         if self.model_type == "gemini":
+            # Imported here: google.genai is heavy and only needed for this backend
+            from google import genai
             api_key = os.getenv("GEMINI_API_KEY")
             self.client = genai.Client(api_key=api_key)
 
-    async def generate_text(self, prompt: str) -> str:
-        if self.model_type == "gemini":
-            return self._gemini_generate(prompt)
+        # Identical concurrent prompts (e.g. several users asking the same thing) share one call
+        self._inflight = AsyncSingleFlight()
 
-        elif self.model_type == "ollama":
-            return self._ollama_generate(prompt)
+        # Static prompt prefix → provider cache name and expiry (Gemini context caching)
+        self._context_caches: Dict[str, tuple[str, float]] = {}
+        self._uncacheable: set[str] = set()
+        self._cache_lock = threading.Lock()
 
-        raise NotImplementedError(f"Unsupported model type: {self.model_type}")
+        # Input-token accounting, to compare prompt sizes with and without prefix caching
+        self.usage = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0}
+        self._usage_lock = threading.Lock()
 
-    def _gemini_generate(self, prompt: str) -> str:
-        response = self.client.models.generate_content(
-            model=self.model_info["model"],
-            contents=prompt
+        # Per-backend concurrency/rate budget (models.json "rate_limit")
+        limits = self.model_info.get("rate_limit", {})
+        self.limiter = AdaptiveLimiter(
+            initial_concurrency=limits.get("initial_concurrency", 4),
+            min_concurrency=limits.get("min_concurrency", 1),
+            max_concurrency=limits.get("max_concurrency", 16),
+            requests_per_minute=limits.get("requests_per_minute"),
+            burst=limits.get("burst", 1),
         )
+        self.max_retries = limits.get("max_retries", 3)
+
+    async def generate_text(self, prompt: str, prefix: Optional[str] = None, priority: str = "plan") -> str:
+        """
+        `prefix` is the static part of the prompt (rules, examples, tool list) and
+        `prompt` the per-call suffix. Backends that support it reuse the prefix
+        across calls; others just see `prefix + prompt`.
+        `priority` is one of rate_limit.PRIORITIES and orders calls when the backend is saturated.
+        """
+        text, _ = await self.generate_text_with_usage(prompt, prefix, priority)
+        return text
+
+    async def generate_text_with_usage(
+        self, prompt: str, prefix: Optional[str] = None, priority: str = "plan"
+    ) -> Tuple[str, dict]:
+        """generate_text plus this call's {"prompt_tokens", "cached_tokens"} (shared by coalesced callers)."""
+        key = make_key(self.model_type, self.model_info["model"], prefix, prompt)
+        return await self._inflight.do(key, self._generate, prompt, prefix, priority)
+
+    async def _generate(self, prompt: str, prefix: Optional[str] = None, priority: str = "plan") -> Tuple[str, dict]:
+        if self.model_type == "gemini":
+            call = self._gemini_generate
+        elif self.model_type == "ollama":
+            call = self._ollama_generate
+        else:
+            raise NotImplementedError(f"Unsupported model type: {self.model_type}")
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.limiter.slot(priority):
+                    # Blocking SDK/HTTP calls run off the event loop so concurrent loops can overlap
+                    result = await asyncio.to_thread(call, prompt, prefix)
+                self.limiter.on_success()
+                return result
+            except Exception as e:
+                if not is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                self.limiter.on_overload()
+                await asyncio.sleep(2 ** attempt)
+
+    def metrics(self) -> dict:
+        """Token usage plus limiter state (concurrency limit, queue depth, queueing delay)."""
+        return {"usage": dict(self.usage), "limiter": self.limiter.metrics()}
+
+    def _record_usage(self, prompt_tokens: Optional[int], cached_tokens: Optional[int] = 0) -> dict:
+        """Add one call to the totals and return its own usage."""
+        usage = {"prompt_tokens": prompt_tokens or 0, "cached_tokens": cached_tokens or 0}
+        with self._usage_lock:
+            self.usage["calls"] += 1
+            self.usage["prompt_tokens"] += usage["prompt_tokens"]
+            self.usage["cached_tokens"] += usage["cached_tokens"]
+        return usage
+
+    def _gemini_context_cache(self, prefix: str) -> Optional[str]:
+        """Return a cached-content name holding `prefix`, creating it on first use."""
+        key = make_key(self.model_info["model"], prefix)
+        with self._cache_lock:
+            if key in self._uncacheable:
+                return None
+            entry = self._context_caches.get(key)
+            if entry and entry[1] > time.time():
+                return entry[0]
+
+            ttl = int(self.model_info.get("context_cache_ttl", 3600))
+            try:
+                from google.genai import types
+                cache = self.client.caches.create(
+                    model=self.model_info["model"],
+                    config=types.CreateCachedContentConfig(
+                        system_instruction=prefix,
+                        ttl=f"{ttl}s"
+                    )
+                )
+            except Exception as e:
+                print(f"[model] Context caching unavailable, sending full prompt: {e}")
+                # A prefix below the provider's minimum size never becomes cacheable; anything else
+                # (429, network) is transient and retried on the next call
+                if _is_cache_too_small(e):
+                    self._uncacheable.add(key)
+                return None
+
+            # Refresh a little before the provider expires it
+            self._context_caches[key] = (cache.name, time.time() + ttl * 0.9)
+            return cache.name
+
+    def _gemini_generate(self, prompt: str, prefix: Optional[str] = None) -> Tuple[str, dict]:
+        cache_name = self._gemini_context_cache(prefix) if prefix else None
+        if cache_name:
+            from google.genai import types
+            response = self.client.models.generate_content(
+                model=self.model_info["model"],
+                contents=prompt,
+                config=types.GenerateContentConfig(cached_content=cache_name)
+            )
+        else:
+            response = self.client.models.generate_content(
+                model=self.model_info["model"],
+                contents=(prefix or "") + prompt
+            )
+
+        metadata = getattr(response, "usage_metadata", None)
+        usage = {"prompt_tokens": 0, "cached_tokens": 0}
+        if metadata is not None:
+            usage = self._record_usage(metadata.prompt_token_count, metadata.cached_content_token_count)
 
         # ✅ Safely extract response text
         try:
-            return response.text.strip()
+            return response.text.strip(), usage
         except AttributeError:
             try:
-                return response.candidates[0].content.parts[0].text.strip()
+                return response.candidates[0].content.parts[0].text.strip(), usage
             except Exception:
-                return str(response)
+                return str(response), usage
 
-    def _ollama_generate(self, prompt: str) -> str:
-        response = requests.post(
-            self.model_info["url"]["generate"],
-            json={"model": self.model_info["model"], "prompt": prompt, "stream": False}
-        )
+    def _ollama_generate(self, prompt: str, prefix: Optional[str] = None) -> Tuple[str, dict]:
+        payload = {
+            "model": self.model_info["model"],
+            "prompt": prompt,
+            "stream": False,
+            # Keep the model (and its KV cache) loaded between agent steps
+            "keep_alive": self.model_info.get("keep_alive", "30m")
+        }
+        if prefix:
+            # Sent as the system prompt so it always leads the rendered template;
+            # Ollama then reuses the KV cache for the unchanged prefix
+            payload["system"] = prefix
+
+        response = requests.post(self.model_info["url"]["generate"], json=payload)
         response.raise_for_status()
-        return response.json()["response"].strip()
+        data = response.json()
+        # prompt_eval_count only counts tokens that were not served from the KV cache
+        usage = self._record_usage(data.get("prompt_eval_count"))
+        return data["response"].strip(), usage
+
+
+# Process-wide registry: one ModelManager per text model, built on first use
+_registry: Dict[str, ModelManager] = {}
+_registry_lock = threading.Lock()
+
+
+def get_model_manager(text_model_key: Optional[str] = None) -> ModelManager:
+    """Return the shared ModelManager for `text_model_key` (profile default if None)."""
+    key = text_model_key or _load_profile()["llm"]["text_generation"]
+    manager = _registry.get(key)
+    if manager is None:
+        with _registry_lock:
+            manager = _registry.get(key)
+            if manager is None:
+                manager = _registry[key] = ModelManager(key)
+    return manager
@@ -4,12 +4,9 @@ import os
 import re
 import json
 from dotenv import load_dotenv
-from modules.model_manager import ModelManager
+from modules.model_manager import get_model_manager
 from modules.tools import summarize_tools
 
-model = ModelManager()
-tool_context = summarize_tools(model.get_all_tools()) if hasattr(model, "get_all_tools") else ""
-
 
 class PerceptionResult(BaseModel):
     user_input: str
@@ -25,25 +22,30 @@ async def extract_perception(user_input: str) -> PerceptionResult:
     - entities: keywords or values
     - tool_hint: likely MCP tool name (optional)
     """
+    model = get_model_manager()
+    tool_context = summarize_tools(model.get_all_tools()) if hasattr(model, "get_all_tools") else ""
 
-    prompt = f"""
+    # Static instructions first so the backend can reuse them; the input goes last
+    prefix = f"""
 You are an AI that extracts structured facts from user input.
 
 Available tools: {tool_context}
 
-Input: "{user_input}"
-
 Return the response as a Python dictionary with keys:
 - intent: (brief phrase about what the user wants)
 - entities: a list of strings representing keywords or values (e.g., ["INDIA", "ASCII"])
 - tool_hint: (name of the MCP tool that might be useful, if any)
-- user_input: same as above
+- user_input: same as the input
 
 Output only the dictionary on a single line. Do NOT wrap it in ```json or other formatting. Ensure `entities` is a list of strings, not a dictionary.
+"""
+
+    prompt = f"""
+Input: "{user_input}"
 """
 
     try:
-        response = await model.generate_text(prompt)
+        response = await model.generate_text(prompt, prefix=prefix, priority="perception")
 
         # Clean up raw if wrapped in markdown-style ```json
         raw = response.strip()
@@ -0,0 +1,105 @@
+# modules/query_cache.py → Document Search Result Cache
+# Role: Answer repeated search_documents queries without touching FAISS, BM25 or the chunk store.
+
+# Responsibilities:
+
+# LRU of result lists keyed by (index generation, normalized query)
+
+# A new index generation (process_documents published) makes every older entry unreachable; they are dropped
+
+# Optional semantic reuse: a query whose embedding is within a cosine threshold of a cached query's
+
+# Hit / miss counts for index_status
+
+# Used by: mcp_server_2.py (search_documents, search_documents_batch)
+
+# modules/query_cache.py
+
+import re
+import threading
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+
+def normalize(query: str) -> str:
+    """Case, punctuation and spacing don't change the results enough to miss the cache over."""
+    return " ".join(re.findall(r"\w+", query.lower()))
+
+
+class Entry(NamedTuple):
+    results: List[dict]
+    vector: Optional[np.ndarray]  # unit-length query embedding, for semantic lookups
+
+
+class QueryCache:
+    def __init__(self, capacity: int = 256, semantic_threshold: Optional[float] = None):
+        self.capacity = capacity
+        self.semantic_threshold = semantic_threshold
+        self._entries: "OrderedDict[str, Entry]" = OrderedDict()
+        self._generation: Optional[int] = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0}
+
+    def _sync(self, generation: int) -> bool:
+        """Drop everything cached for another generation; False if `generation` is older than the cache's."""
+        if self._generation is not None and generation < self._generation:
+            return False  # a stale snapshot still in use: don't cache or serve across generations
+        if generation != self._generation:
+            self._entries.clear()
+            self._generation = generation
+        return True
+
+    def get(self, generation: int, query: str) -> Optional[List[dict]]:
+        """Exact (normalized) match. On None, call similar(), which also records the miss."""
+        with self._lock:
+            entry = self._entries.get(normalize(query)) if self._sync(generation) else None
+            if entry is None:
+                return None
+            self._entries.move_to_end(normalize(query))
+            self.stats["hits"] += 1
+            return entry.results
+
+    def similar(self, generation: int, query: str, vector: np.ndarray) -> Optional[List[dict]]:
+        """Results of the closest cached query if its cosine similarity reaches the threshold."""
+        if self.semantic_threshold is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        vector = _unit(vector)
+        with self._lock:
+            candidates = [(key, e) for key, e in self._entries.items() if e.vector is not None] if self._sync(generation) else []
+            if candidates:
+                similarity = np.stack([e.vector for _, e in candidates]) @ vector
+                best = int(np.argmax(similarity))
+                if similarity[best] >= self.semantic_threshold:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    # Later repeats of this wording become exact hits
+                    self._store(normalize(query), Entry(entry.results, vector))
+                    self.stats["semantic_hits"] += 1
+                    return entry.results
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, generation: int, query: str, results: List[dict], vector: Optional[np.ndarray] = None):
+        with self._lock:
+            if self._sync(generation):
+                self._store(normalize(query), Entry(results, _unit(vector) if vector is not None else None))
+
+    def _store(self, key: str, entry: Entry):
+        if self.capacity <= 0:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
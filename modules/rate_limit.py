@@ -0,0 +1,173 @@
+# modules/rate_limit.py → LLM Call Governor
+# Role: Keep concurrent agent loops inside a backend's rate limits instead of failing on 429s.
+
+# Responsibilities:
+
+# AIMD concurrency limit: grow slowly on success, halve on overload (429)
+
+# Token bucket: cap requests per minute with a small burst
+
+# Priority classes: final answers are admitted before planning, perception and speculative calls
+
+# Track queueing delay per priority
+
+# Used by: model_manager.py
+
+# modules/rate_limit.py
+
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+# Lower value = admitted first
+PRIORITIES = {
+    "final": 0,
+    "plan": 1,
+    "perception": 2,
+    "speculative": 3,
+}
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """True for HTTP 429 / RESOURCE_EXHAUSTED errors from either backend."""
+    if getattr(error, "code", None) == 429:
+        return True
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    return "RESOURCE_EXHAUSTED" in str(error)
+
+
+class TokenBucket:
+    """Requests-per-minute budget. Reservations may go negative so waiters are served in order."""
+
+    def __init__(self, requests_per_minute: float, burst: int = 1):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class AdaptiveLimiter:
+    """
+    Priority-ordered concurrency limiter with an AIMD limit and an optional token bucket.
+    Use `async with limiter.slot("plan"): ...` around each upstream call.
+    """
+
+    def __init__(
+        self,
+        initial_concurrency: int = 4,
+        min_concurrency: int = 1,
+        max_concurrency: int = 16,
+        requests_per_minute: Optional[float] = None,
+        burst: int = 1,
+        backoff_factor: float = 0.5,
+    ):
+        self.limit = float(initial_concurrency)
+        self.min_limit = float(min_concurrency)
+        self.max_limit = float(max_concurrency)
+        self.backoff_factor = backoff_factor
+        self.bucket = TokenBucket(requests_per_minute, burst) if requests_per_minute else None
+
+        self.in_flight = 0
+        self._waiters: List[tuple] = []
+        self._seq = itertools.count()
+
+        self.stats = {
+            "admitted": 0,
+            "overloads": 0,
+            "queue_delay_total": 0.0,
+            "queue_delay_max": 0.0,
+            "by_priority": {name: {"admitted": 0, "queue_delay_total": 0.0} for name in PRIORITIES},
+        }
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < max(int(self.limit), 1)
+
+    def _wake(self):
+        while self._waiters and self._has_capacity():
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():  # waiter was cancelled
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    async def _acquire(self, priority: str):
+        if self._has_capacity() and not self._waiters:
+            self.in_flight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (PRIORITIES.get(priority, PRIORITIES["plan"]), next(self._seq), future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Slot was handed over just as we were cancelled: give it back
+                    self._release()
+                raise
+
+        if self.bucket:
+            try:
+                await self.bucket.acquire()
+            except asyncio.CancelledError:
+                self._release()
+                raise
+
+    def _release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "plan"):
+        queued_at = time.monotonic()
+        await self._acquire(priority)
+        self._record_delay(priority, time.monotonic() - queued_at)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _record_delay(self, priority: str, delay: float):
+        self.stats["admitted"] += 1
+        self.stats["queue_delay_total"] += delay
+        self.stats["queue_delay_max"] = max(self.stats["queue_delay_max"], delay)
+        bucket = self.stats["by_priority"].setdefault(priority, {"admitted": 0, "queue_delay_total": 0.0})
+        bucket["admitted"] += 1
+        bucket["queue_delay_total"] += delay
+
+    def on_success(self):
+        # Additive increase: roughly +1 per `limit` successful calls
+        self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        self._wake()
+
+    def on_overload(self):
+        # Multiplicative decrease on 429
+        self.stats["overloads"] += 1
+        self.limit = max(self.min_limit, self.limit * self.backoff_factor)
+
+    def metrics(self) -> Dict[str, object]:
+        admitted = self.stats["admitted"] or 1
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "admitted": self.stats["admitted"],
+            "overloads": self.stats["overloads"],
+            "queue_delay_avg_ms": round(self.stats["queue_delay_total"] / admitted * 1000, 1),
+            "queue_delay_max_ms": round(self.stats["queue_delay_max"] * 1000, 1),
+            "queue_delay_avg_ms_by_priority": {
+                name: round(b["queue_delay_total"] / (b["admitted"] or 1) * 1000, 1)
+                for name, b in self.stats["by_priority"].items()
+            },
+        }
@@ -0,0 +1,95 @@
+# modules/singleflight.py → In-flight Request Coalescing
+# Role: Share one upstream call between concurrent callers asking the exact same thing.
+
+# Responsibilities:
+
+# Key each call by (model, prompt/text, params)
+
+# First caller runs the request, followers wait on its result
+
+# Keys are dropped as soon as the call finishes (no result caching)
+
+# Used by: model_manager.py (LLM calls), memory.py and mcp_server_2.py (embeddings)
+
+# modules/singleflight.py
+
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+def make_key(*parts: Any) -> str:
+    """Stable digest for a request: model name, prompt and any params."""
+    raw = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Thread-safe coalescing for blocking calls (e.g. HTTP embedding requests).
+    Concurrent `do()` calls with the same key share a single execution.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.stats = {"calls": 0, "shared": 0}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            self.stats["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.stats["shared"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    """
+    asyncio flavour: the first caller's coroutine runs as a task and every
+    caller awaits it shielded, so one caller being cancelled does not
+    cancel the shared request for the others.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {"calls": 0, "shared": 0}
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        self.stats["calls"] += 1
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._tasks[key] = task
+            task.add_done_callback(lambda _t, k=key: self._tasks.pop(k, None))
+        else:
+            self.stats["shared"] += 1
+        return await asyncio.shield(task)
@@ -0,0 +1,120 @@
+# modules/vector_index.py → FAISS Index Factory
+# Role: Pick and build the FAISS index type for a vector collection.
+
+# Responsibilities:
+
+# Cosine scoring: vectors are L2-normalized and searched by inner product
+
+# Index types: flat (exact), hnsw (graph), ivf (inverted lists, needs training)
+
+# "auto": flat while small, promoted to hnsw / ivf at configured sizes
+
+# Search parameters (efSearch / nprobe) with optional id selectors
+
+# Used by: memory.py (MemoryManager)
+
+# modules/vector_index.py
+
+from typing import Optional
+
+import faiss
+import numpy as np
+
+DEFAULTS = {
+    "type": "auto",            # auto | flat | hnsw | ivf
+    "hnsw_threshold": 20_000,  # auto: flat → hnsw at this many vectors
+    "ivf_threshold": 1_000_000,  # auto: hnsw → ivf at this many vectors
+    "hnsw_m": 32,
+    "hnsw_ef_construction": 80,
+    "hnsw_ef_search": 64,
+    "ivf_nlist": None,         # default: 4 * sqrt(n)
+    "ivf_min_train": 10_000,   # below this, ivf falls back to flat (too few points to train lists)
+    "ivf_nprobe": 16,
+}
+
+
+def index_config(config: Optional[dict]) -> dict:
+    return {**DEFAULTS, **(config or {})}
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Unit-length float32 copy, so inner product == cosine similarity."""
+    vectors = np.array(vectors, dtype=np.float32, copy=True, ndmin=2)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def choose_kind(config: dict, n: int) -> str:
+    kind = config["type"]
+    if kind == "auto":
+        kind = "ivf" if n >= config["ivf_threshold"] else "hnsw" if n >= config["hnsw_threshold"] else "flat"
+    if kind == "ivf" and n < config["ivf_min_train"]:
+        return "flat"
+    return kind
+
+
+# flat < hnsw < ivf: automatic promotion only moves right
+RANK = {"flat": 0, "hnsw": 1, "ivf": 2}
+
+
+def kind_of(index: faiss.IndexIDMap2) -> str:
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def make_index(kind: str, dim: int, config: dict, train_vectors: Optional[np.ndarray] = None) -> faiss.IndexIDMap2:
+    """Empty, id-mapped, inner-product index of the given kind (IVF is trained on `train_vectors`)."""
+    if kind == "hnsw":
+        inner = faiss.IndexHNSWFlat(dim, config["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+        inner.hnsw.efConstruction = config["hnsw_ef_construction"]
+    elif kind == "ivf":
+        n = 0 if train_vectors is None else len(train_vectors)
+        nlist = config["ivf_nlist"] or max(1, int(4 * np.sqrt(max(n, 1))))
+        nlist = min(nlist, max(1, n // 39))  # FAISS wants ~39 training points per list
+        quantizer = faiss.IndexFlatIP(dim)
+        inner = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        inner.train(train_vectors)
+        inner.make_direct_map()  # keeps reconstruct() working for exact/filtered search
+    else:
+        inner = faiss.IndexFlatIP(dim)
+
+    return faiss.IndexIDMap2(inner)
+
+
+def all_vectors(index: faiss.IndexIDMap2, drop_ids=None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Copies of the (ids, vectors) currently stored, without `drop_ids`. Call it while holding the
+    lock that guards adds to `index`: the id map and the vectors must be read as one state.
+    """
+    ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+    if len(ids) == 0:
+        return ids, np.empty((0, index.d), dtype=np.float32)
+    vectors = index.index.reconstruct_n(0, index.ntotal)
+    if drop_ids:
+        keep = ~np.isin(ids, np.fromiter(drop_ids, dtype=np.int64, count=len(drop_ids)))
+        ids, vectors = ids[keep], vectors[keep]
+    return ids, vectors
+
+
+def build(kind: str, dim: int, config: dict, ids: np.ndarray, vectors: np.ndarray) -> faiss.IndexIDMap2:
+    """New index of `kind` holding `vectors` under `ids`; touches no shared index, so no lock is needed."""
+    if kind == "ivf" and len(ids) < config["ivf_min_train"]:
+        kind = "flat"
+    fresh = make_index(kind, dim, config, train_vectors=vectors if kind == "ivf" else None)
+    if len(ids):
+        fresh.add_with_ids(vectors, ids)
+    return fresh
+
+
+def search_params(index: faiss.IndexIDMap2, config: dict, selector=None):
+    """Per-type search knobs, optionally restricted to `selector`."""
+    kind = kind_of(index)
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=config["hnsw_ef_search"])
+    if kind == "ivf":
+        return faiss.SearchParametersIVF(sel=selector, nprobe=config["ivf_nprobe"])
+    return faiss.SearchParameters(sel=selector) if selector is not None else None
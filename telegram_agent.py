@@ -2,6 +2,7 @@ import asyncio
 import yaml
 from core.loop import AgentLoop
 from core.session import MultiMCP
+from modules.model_manager import get_model_manager
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 import os
@@ -68,11 +69,13 @@ class TelegramAgent:
             # Create agent loop
             agent = AgentLoop(
                 user_input=user_input,
-                dispatcher=self.multi_mcp
+                dispatcher=self.multi_mcp,
+                scope=f"telegram:{update.effective_chat.id}"
             )
             
             # Run agent and get response
             final_response = await agent.run()
+            log("metrics", f"LLM limiter: {get_model_manager().metrics()['limiter']}")
             clean_response = final_response.replace("FINAL_ANSWER:", "").strip()
             
             # Send response in chunks if needed
@@ -121,6 +124,9 @@ class TelegramAgent:
                 # Then stop the application
                 if self.app.running:
                     await self.app.stop()
+
+                # And the MCP servers kept open across tool calls
+                await self.multi_mcp.shutdown()
                     
             except Exception as e:
                 print(f"Error during shutdown: {e}")